@@ -0,0 +1,159 @@
+"""Headless batch analyzer: run a directory of tablet images through the analysis pipeline.
+
+Example:
+    python batch.py photos/ --output results.jsonl --concurrency 8 --medications "Aspirin, Metformin"
+
+Results are appended to the JSONL output as they finish; re-running the same
+command skips images that already have a successful record, so an interrupted
+run resumes where it stopped.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import usage
+from core import DrugAnalyzer, DrugReport
+from image_prep import ImageTooLarge
+from usage import BudgetExceeded
+
+logger = logging.getLogger("batch")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+# Failures that a retry cannot fix
+PERMANENT_ERRORS = (BudgetExceeded, ImageTooLarge)
+
+
+def find_images(directory):
+    """Yield image paths under directory in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def load_completed(output_path):
+    """Return the set of image paths that already have a successful result."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["path"])
+    return completed
+
+
+def with_retries(func, retries, backoff):
+    """Call func, retrying failures other than PERMANENT_ERRORS with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return func(), attempt + 1
+        except PERMANENT_ERRORS:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning("Attempt %d failed (%s); retrying in %.1fs", attempt + 1, e, delay)
+            time.sleep(delay)
+
+
+def analyze_image(analyzer, path, medications, retries, backoff):
+    """Analyze one image and return its JSON-serializable result record."""
+    started = time.perf_counter()
+    record = {"path": path}
+    with usage.track() as image_usage:
+        try:
+            with open(path, "rb") as image_file:
+                image_bytes = image_file.read()
+            record["sha256"] = hashlib.sha256(image_bytes).hexdigest()
+            analysis, attempts = with_retries(
+                lambda: analyzer.extract_composition_and_details(image_bytes), retries, backoff
+            )
+            if not analysis:
+                raise ValueError("empty analysis response")
+            report = DrugReport.parse(analysis)
+            record["analysis"] = analysis
+            record["sections"] = report.as_dict()
+            if medications:
+                composition = report.composition or "Unknown composition"
+                record["interactions"], _ = with_retries(
+                    lambda: analyzer.analyze_drug_interactions(composition, medications), retries, backoff
+                )
+            record.update(status="ok", attempts=attempts)
+        except Exception as e:
+            record.update(status="error", error=str(e))
+    record["usage"] = image_usage.as_dict()
+    record["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of tablet images and write JSONL results.")
+    parser.add_argument("directory", help="directory to scan recursively for images")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file to append results to (also the resume checkpoint)")
+    parser.add_argument(
+        "--concurrency", type=int, default=4,
+        help="maximum number of analyses in flight, and of image and interaction model calls each "
+             "(MEDISCAN_VISION_CONCURRENCY and MEDISCAN_INTERACTION_CONCURRENCY override the latter)"
+    )
+    parser.add_argument("--retries", type=int, default=3, help="retries per image after the first attempt")
+    parser.add_argument("--backoff", type=float, default=2.0, help="base backoff delay in seconds")
+    parser.add_argument("--medications", default="", help="optional medication list to check interactions against")
+    parser.add_argument("--metrics", help="write stage latency metrics here when done (.prom for Prometheus text, else JSON)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    google_api_key = os.environ.get("GOOGLE_API_KEY")
+    tavily_api_key = os.environ.get("TAVILY_API_KEY")
+    if not google_api_key or not tavily_api_key:
+        logger.error("GOOGLE_API_KEY and TAVILY_API_KEY must be set in the environment")
+        return 2
+
+    completed = load_completed(args.output)
+    pending = [path for path in find_images(args.directory) if path not in completed]
+    logger.info("%d images to analyze (%d already done)", len(pending), len(completed))
+
+    # Without matching call budgets, the extra workers would only wait in the limiter queues
+    analyzer = DrugAnalyzer(google_api_key, tavily_api_key, max_concurrent=max(1, args.concurrency))
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = [
+            pool.submit(analyze_image, analyzer, path, args.medications, args.retries, args.backoff)
+            for path in pending
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            if record["status"] != "ok":
+                failures += 1
+            # Only this thread writes, and every line is flushed so a crash loses at most one record
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+            logger.info("[%d/%d] %s: %s", done, len(pending), record["path"], record["status"])
+
+    logger.info("Finished: %d succeeded, %d failed", len(pending) - failures, failures)
+    if args.metrics:
+        metrics.REGISTRY.dump(args.metrics)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""Offline performance benchmarks using fake Gemini and Tavily stand-ins (no API quota used).
+
+    python benchmark.py --output before.json
+    python benchmark.py --only pdf parser --repeat 20 --output after.json
+
+Every run works in a fresh temporary directory, so caches start cold and nothing
+on disk is touched. Run the same command on two commits and compare the JSON
+files to spot regressions.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = ("startup", "rerun", "pdf", "parser", "thumbnail", "concurrency")
+IMAGE_SIZES = ((640, 480), (1600, 1200), (4000, 3000))
+# Paragraphs per section in the small, medium and large PDF reports
+REPORT_SIZES = {"small": 1, "medium": 10, "large": 50}
+INTERACTION_MEDICATIONS = "Aspirin 75mg daily, Ibuprofen 400mg as needed"
+# Slow imports that ml.py should only load once an analysis or a PDF is requested
+DEFERRED_MODULES = ("phi.agent", "google.generativeai", "tavily", "reportlab", "pandas")
+SLOWEST_IMPORTS = 15
+
+
+def summarize(samples):
+    """Timing statistics in seconds for a list of samples."""
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[max(0, round(0.95 * len(ordered)) - 1)],
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+def measure(fn, repeat, warmup=1):
+    """Time fn() repeat times after warmup untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def sample_image(width, height, seed=0):
+    """Deterministic photo-like JPEG: a gradient with noise, so it compresses like a real photo."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = gradient + rng.normal(0, 40, (height, width, 3))
+    output = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def sample_report(paragraphs):
+    """A DrugReport with every section holding the given number of paragraphs."""
+    from core import SECTION_FIELDS, DrugReport
+    from fake_models import FAKE_COMPOSITION
+
+    paragraph = "This sentence stands in for a line of researched drug information. " * 6
+    sections = {field: "\n".join([paragraph] * paragraphs) for field in SECTION_FIELDS.values()}
+    sections["composition"] = FAKE_COMPOSITION
+    report = DrugReport(None, **sections)
+    report.raw = report.to_text()
+    return report
+
+
+def startup_imports():
+    """Absolute top-level imports of ml.py, read from its source."""
+    with open(os.path.join(REPO_DIR, "ml.py"), encoding="utf-8") as source:
+        tree = ast.parse(source.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def parse_importtime(stderr):
+    """{top-level module: cumulative seconds} from python -X importtime output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        # Nested imports are indented past the single leading space
+        if not name.startswith("  "):
+            cumulative[name.strip()] = int(total) / 1_000_000
+    return cumulative
+
+
+def bench_startup(args):
+    """Import cost of ml.py's modules plus building the DrugAnalyzer, as a new worker pays it.
+
+    Each run is a fresh interpreter under python -X importtime. Also lists the slowest
+    imports and any DEFERRED_MODULES that were loaded anyway.
+    """
+    code = "\n".join(
+        [f"import {module}" for module in startup_imports()]
+        + [
+            "import core, json, sys",
+            "core.DrugAnalyzer('benchmark', 'benchmark')",
+            f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))",
+        ]
+    )
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, check=True
+        )
+        samples.append(time.perf_counter() - started)
+        imports = parse_importtime(completed.stderr)
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_IMPORTS]
+    return {
+        "process_seconds": summarize(samples),
+        "import_seconds": sum(imports.values()),
+        "slowest_imports": dict(slowest),
+        "deferred_modules_loaded": json.loads(completed.stdout.splitlines()[-1]),
+    }
+
+
+def bench_rerun(args):
+    """Cost of one Streamlit script run of ml.py, on an empty page and with a finished report."""
+    from streamlit.testing.v1 import AppTest
+
+    from blob_store import BlobStore
+
+    def new_app():
+        app = AppTest.from_file(os.path.join(REPO_DIR, "ml.py"), default_timeout=120)
+        app.secrets["GOOGLE_API_KEY"] = "benchmark"
+        app.secrets["TAVILY_API_KEY"] = "benchmark"
+        return app
+
+    app = new_app()
+    started = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - started
+    results = {"cold_start_seconds": cold, "empty_page": measure(app.run, args.repeat)}
+
+    report = sample_report(REPORT_SIZES["medium"])
+    app = new_app()
+    app.session_state["drug_report"] = report
+    app.session_state["original_image"] = BlobStore().put(sample_image(1600, 1200))
+    app.session_state["interaction_analysis"] = "**Minor interaction.** No dose adjustment is usually needed."
+    app.session_state["additional_medications"] = INTERACTION_MEDICATIONS
+    results["with_report"] = measure(app.run, args.repeat)
+    if app.exception:
+        raise RuntimeError(f"ml.py raised during the rerun benchmark: {app.exception[0].value}")
+    return results
+
+
+def bench_pdf(args):
+    """create_pdf build time across report sizes."""
+    from report import create_pdf
+
+    image = sample_image(1600, 1200)
+    results = {}
+    for name, paragraphs in REPORT_SIZES.items():
+        report = sample_report(paragraphs)
+        pdf_bytes = create_pdf(image, report, "**Minor interaction.**", INTERACTION_MEDICATIONS)
+        results[name] = measure(
+            lambda: create_pdf(image, report, "**Minor interaction.**", INTERACTION_MEDICATIONS), args.repeat
+        )
+        results[name]["pdf_bytes"] = len(pdf_bytes)
+    return results
+
+
+def bench_parser(args):
+    """DrugReport.parse throughput on a response of roughly args.parser_mb megabytes."""
+    from core import DrugReport
+
+    report = sample_report(1)
+    text = report.to_text()
+    text = text * max(1, int(args.parser_mb * 1_000_000 / len(text)))
+    timings = measure(lambda: DrugReport.parse(text), args.repeat)
+    timings["response_bytes"] = len(text.encode("utf-8"))
+    timings["mb_per_second"] = timings["response_bytes"] / 1_000_000 / timings["median"]
+    return timings
+
+
+def bench_thumbnail(args):
+    """Display thumbnail and model-input preparation cost across upload sizes."""
+    from image_prep import make_thumbnail, prepare_for_model
+
+    results = {}
+    for width, height in IMAGE_SIZES:
+        image = sample_image(width, height)
+        results[f"{width}x{height}"] = {
+            "upload_bytes": len(image),
+            "thumbnail": measure(lambda: make_thumbnail(image, 300), args.repeat),
+            "prepare_for_model": measure(lambda: prepare_for_model(image), args.repeat),
+        }
+    return results
+
+
+def bench_concurrency(args):
+    """End-to-end analysis plus interaction check for N simultaneous sessions, each with its own photo."""
+    import metrics
+    import usage
+    from core import DrugAnalyzer, DrugReport
+    from fake_models import FakeModel, FakeSearchClient
+    from rate_limit import RateLimiter
+    from search_tools import SearchPool
+
+    search_client = FakeSearchClient(args.search_latency, args.latency_sigma)
+    composition_models, analysis_models = [], []
+
+    def composition_model():
+        model = FakeModel(latency=args.composition_latency, latency_sigma=args.latency_sigma)
+        composition_models.append(model)
+        return model
+
+    def analysis_model():
+        model = FakeModel(latency=args.model_latency, latency_sigma=args.latency_sigma, searches=args.searches)
+        analysis_models.append(model)
+        return model
+
+    analyzer = DrugAnalyzer(
+        "benchmark", "benchmark",
+        composition_model=composition_model,
+        analysis_model=analysis_model,
+        search_pool=SearchPool("benchmark", client=search_client),
+    )
+    analyzer.vision_limiter = RateLimiter("vision", args.rpm, args.concurrency)
+    analyzer.interaction_limiter = RateLimiter("interaction", args.rpm, args.concurrency)
+    images = [sample_image(1600, 1200, seed=session) for session in range(args.sessions)]
+    # Only report stages timed during this benchmark
+    metrics.REGISTRY.reset()
+
+    def session(image):
+        started = time.perf_counter()
+        analysis = analyzer.extract_composition_and_details(image)
+        analyzer.analyze_drug_interactions(DrugReport.parse(analysis).composition, INTERACTION_MEDICATIONS)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        latencies = list(pool.map(session, images))
+    wall = time.perf_counter() - started
+
+    snapshot = metrics.snapshot()
+    stages = {
+        stage: {key: stats[key] for key in ("count", "p50", "p95", "p99")}
+        for stage, stats in snapshot["stages"].items()
+    }
+    return {
+        "sessions": args.sessions,
+        "wall_seconds": wall,
+        "sessions_per_second": args.sessions / wall,
+        "session_latency": summarize(latencies),
+        "model_calls": sum(model.calls for model in composition_models + analysis_models),
+        "search_calls": search_client.calls,
+        "usage": {field: snapshot["counters"].get(field, 0) for field in usage.FIELDS},
+        "stages": stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run offline MediScan performance benchmarks.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per measurement")
+    parser.add_argument("--parser-mb", type=float, default=1.0, help="size of the parsed response in MB")
+    parser.add_argument("--sessions", type=int, default=8, help="simulated concurrent sessions")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="median full-model call seconds")
+    parser.add_argument("--composition-latency", type=float, default=0.3, help="median composition call seconds")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="median Tavily search seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of fake latencies")
+    parser.add_argument("--searches", type=int, default=2, help="searches per full-model call")
+    parser.add_argument("--rpm", type=float, default=6000, help="rate limit for fake model calls per minute")
+    parser.add_argument("--concurrency", type=int, default=8, help="model calls in flight")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.output)
+    sys.path.insert(0, REPO_DIR)
+    # Caches, indexes and interaction tables all resolve relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="mediscan-bench-"))
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "benchmarks": {},
+    }
+    runners = {name: globals()[f"bench_{name}"] for name in BENCHMARKS}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...", flush=True)
+        started = time.perf_counter()
+        results["benchmarks"][name] = runners[name](args)
+        print(f"  done in {time.perf_counter() - started:.1f}s", flush=True)
+
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Content-addressed, reference-counted store for uploaded images shared by every session.
+
+Sessions keep a BlobRef (the SHA-256 of the bytes) instead of the bytes, so an
+image uploaded by several users is held once. Recently used blobs stay in a
+byte-bounded in-memory LRU; every blob is also written to a file that is read
+back through mmap, so cold blobs are served from the OS page cache instead of
+the Python heap. A blob is deleted from both tiers when its last BlobRef is
+garbage collected, e.g. when Streamlit drops an expired session's state.
+"""
+import atexit
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+BLOB_MEMORY_BYTES = int(os.environ.get("MEDISCAN_BLOB_MEMORY_BYTES", 64_000_000))
+# Defaults to a private temporary directory removed at exit
+BLOB_DIR = os.environ.get("MEDISCAN_BLOB_DIR")
+
+
+class BlobRef:
+    """One holder's reference to a stored blob; releasing it is left to garbage collection."""
+
+    __slots__ = ("digest", "size", "_store", "__weakref__")
+
+    def __init__(self, store, digest, size):
+        self.digest = digest
+        self.size = size
+        self._store = store
+
+    def read(self):
+        """The blob's contents: bytes from memory, or a read-only mmap of its file."""
+        return self._store.get(self.digest)
+
+
+class BlobStore:
+    """Deduplicating blob store with an in-memory LRU tier over a memory-mapped file tier."""
+
+    def __init__(self, directory=BLOB_DIR, memory_bytes=BLOB_MEMORY_BYTES):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="mediscan-blobs-")
+            # References never outlive the process, so neither do their files
+            atexit.register(shutil.rmtree, directory, True)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        # digest -> [reference count, size]
+        self._blobs = {}
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self.memory_hits = 0
+        self.disk_reads = 0
+        self._lock = threading.Lock()
+        # Digests of garbage-collected references, not yet subtracted
+        self._released = deque()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def put(self, data):
+        """Store data (once per distinct content) and return a new BlobRef to it."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._drain()
+            blob = self._blobs.get(digest)
+            if blob is None:
+                temp_path = f"{self._path(digest)}.tmp"
+                with open(temp_path, "wb") as blob_file:
+                    blob_file.write(data)
+                os.replace(temp_path, self._path(digest))
+                blob = self._blobs[digest] = [0, len(data)]
+            blob[0] += 1
+            self._remember(digest, bytes(data))
+        ref = BlobRef(self, digest, len(data))
+        # Interpreter exit removes the whole directory instead
+        weakref.finalize(ref, self._release, digest).atexit = False
+        return ref
+
+    def get(self, digest):
+        """Contents of a stored blob, or None if it has been released."""
+        with self._lock:
+            self._drain()
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                self.memory_hits += 1
+                return data
+            if digest not in self._blobs:
+                return None
+            self.disk_reads += 1
+            with open(self._path(digest), "rb") as blob_file:
+                return mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _remember(self, digest, data):
+        """Put data at the recent end of the memory tier, evicting the least recently used beyond the budget."""
+        if len(data) > self.memory_bytes:
+            return
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return
+        self._memory[digest] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def _release(self, digest):
+        # Garbage collection can run this on a thread that already holds the lock, in
+        # the middle of an update, so it only queues the digest. The queue is drained
+        # here when the lock is free, and otherwise by the next call that takes it.
+        self._released.append(digest)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._drain()
+            finally:
+                self._lock.release()
+
+    def _drain(self):
+        """Subtract queued released references, deleting blobs that have none left; needs the lock."""
+        while self._released:
+            digest = self._released.popleft()
+            blob = self._blobs[digest]
+            blob[0] -= 1
+            if blob[0]:
+                continue
+            del self._blobs[digest]
+            evicted = self._memory.pop(digest, None)
+            if evicted is not None:
+                self._memory_used -= len(evicted)
+            # Under the lock, so a concurrent put of the same content cannot lose its file
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            self._drain()
+            return {
+                "blobs": len(self._blobs),
+                "references": sum(count for count, _ in self._blobs.values()),
+                "disk_bytes": sum(size for _, size in self._blobs.values()),
+                "memory_blobs": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_hits": self.memory_hits,
+                "disk_reads": self.disk_reads,
+            }
@@ -0,0 +1,678 @@
+"""Streamlit-free analysis core shared by the web app and the batch analyzer."""
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from drug_index import composition_key, ingredient_key, open_default_index
+from hedging import Deadline, LatencyHistogram, hedged_call
+from image_prep import PREPARE_VERSION, check_upload, prepare_for_model
+from interaction_matrix import open_default_matrix
+from interactions import InteractionEngine
+import metrics
+from med_normalizer import MedicationNormalizer
+from phash import NearDuplicateIndex, dhash
+from result_cache import ResultCache, content_key
+from rate_limit import limiter_from_env
+from search_tools import SearchPool
+from singleflight import SingleFlight
+import usage
+from usage import Usage, UsageLedger, estimate_image_tokens
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = os.environ.get("MEDISCAN_ANALYSIS_MODEL", "gemini-2.5-flash")
+# Cheaper model for the tool-free first stage that only reads the composition
+COMPOSITION_MODEL_ID = os.environ.get("MEDISCAN_COMPOSITION_MODEL", "gemini-2.5-flash-lite")
+# Read the composition first and research only what the caches and the index lack
+# (set MEDISCAN_CASCADE=0 for a single full analysis call per image)
+CASCADE = os.environ.get("MEDISCAN_CASCADE", "1") != "0"
+# Most web searches a single agent run may make before it has to answer
+TOOL_CALL_LIMIT = int(os.environ.get("MEDISCAN_TOOL_CALL_LIMIT", 6))
+
+SYSTEM_PROMPT = """
+You are an expert in pharmaceutical analysis and AI-driven drug composition recognition with specialized knowledge in drug safety and interactions.
+Your role is to analyze a tablet's composition from an image, identify its ingredients, and provide comprehensive insights about the drug including safety considerations.
+
+Additionally, once a drug composition is identified, retrieve and display its uses, side effects, cost, available tablet names/brands, usage instructions, and critical safety information using reliable medical sources.
+Ensure that you fetch accurate and specific details instead of generic placeholders.
+"""
+
+# START OF CRITICAL CHANGE: REVISED INSTRUCTIONS FOR STRUCTURE AND CONTENT
+INSTRUCTIONS = """
+- Extract the drug composition from the tablet image.
+- Use this composition to fetch and return detailed, medically accurate information from trusted sources.
+- **CRITICAL FORMATTING:** Return ALL information in a strict key-value format using asterisks. Do NOT use bullet points, numbered lists, or fragmented text outside of the section content.
+- **CRITICAL CONTENT:** Provide only medical/scientific uses and avoid manufacturer promotional language.
+
+- Return all information in this exact structured format:
+  *Composition:* <composition>
+  *Uses:* <accurate medical/scientific uses based on online sources>
+  *Available Tablet Names:* <list of brand names and generic names that contain this composition>
+  *How to Use:* <detailed dosage instructions, timing, with or without food>
+  *Side Effects:* <verified side effects>
+  *Cost:* <actual cost from trusted sources>
+  *Safety with Alcohol:* <specific advice about alcohol consumption>
+  *Pregnancy Safety:* <pregnancy category and safety advice>
+  *Breastfeeding Safety:* <safety for nursing mothers>
+  *Driving Safety:* <effects on driving ability>
+  *General Safety Advice:* <additional precautions and contraindications>
+"""
+# END OF CRITICAL CHANGE
+
+DRUG_INTERACTION_PROMPT = """
+You are a pharmaceutical expert specializing in drug interactions and safety analysis.
+Analyze the potential interactions between the identified drug composition and the additional medications provided by the user.
+
+Provide detailed interaction analysis including:
+- Severity level of interactions (None, Minor, Moderate, Major, Severe)
+- Specific interaction mechanisms
+- Clinical significance
+- Recommended actions or precautions
+- Alternative suggestions if dangerous interactions exist
+
+Be thorough and prioritize patient safety in your analysis.
+"""
+
+PAIR_INTERACTION_QUERY = """
+Analyze potential drug interactions between:
+Primary Drug: {primary}
+Additional Medication: {other}
+
+Provide detailed interaction analysis with severity level and safety recommendations.
+"""
+
+# Result sections in display order: (section name, icon, section type)
+SECTIONS = [
+    ("Composition", "🧬", "composition"),
+    ("Uses", "🎯", "uses"),
+    ("Available Tablet Names", "💊", "tablet_names"),
+    ("How to Use", "📋", "usage"),
+    ("Side Effects", "⚠️", "side_effects"),
+    ("Cost", "💰", "cost"),
+    ("Safety with Alcohol", "🍺", "safety"),
+    ("Pregnancy Safety", "🤱", "safety"),
+    ("Breastfeeding Safety", "🍼", "safety"),
+    ("Driving Safety", "🚗", "safety"),
+    ("General Safety Advice", "🛡️", "safety")
+]
+# DrugReport attribute for each section
+SECTION_FIELDS = {
+    "Composition": "composition",
+    "Uses": "uses",
+    "Available Tablet Names": "tablet_names",
+    "How to Use": "how_to_use",
+    "Side Effects": "side_effects",
+    "Cost": "cost",
+    "Safety with Alcohol": "alcohol_safety",
+    "Pregnancy Safety": "pregnancy_safety",
+    "Breastfeeding Safety": "breastfeeding_safety",
+    "Driving Safety": "driving_safety",
+    "General Safety Advice": "general_safety",
+}
+SECTIONS_BY_NAME = {name.lower(): (name, icon, section_type) for name, icon, section_type in SECTIONS}
+# Accepts both *Name:* and markdown-bold **Name:** headers
+SECTION_HEADER_PATTERN = re.compile(
+    r"\*{1,2}\s*(" + "|".join(re.escape(name) for name, _, _ in SECTIONS) + r")\s*:\s*\*{1,2}", re.IGNORECASE
+)
+
+# Optional JSON output mode (MEDISCAN_STRUCTURED_OUTPUT=1); the key-value format stays the default
+STRUCTURED_OUTPUT = os.environ.get("MEDISCAN_STRUCTURED_OUTPUT", "0") == "1"
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string", "description": name} for name, field in SECTION_FIELDS.items()},
+    "required": list(SECTION_FIELDS.values()),
+}
+
+# Gemini rejects response_mime_type=application/json when tools are enabled,
+# so the schema is declared in the instructions and validated on our side
+JSON_INSTRUCTIONS = f"""
+- Extract the drug composition from the tablet image.
+- Use this composition to fetch and return detailed, medically accurate information from trusted sources.
+- **CRITICAL CONTENT:** Provide only medical/scientific uses and avoid manufacturer promotional language.
+- **CRITICAL FORMATTING:** Respond with a single JSON object and nothing else. It must match this JSON schema,
+  with every value a plain string:
+{json.dumps(RESPONSE_SCHEMA, indent=2)}
+"""
+
+FIELD_REPAIR_QUERY = """
+Earlier analysis of this tablet image was missing some fields.
+Known composition: {composition}
+Respond with a single JSON object containing only these keys, each with a plain string value: {fields}
+"""
+
+# First cascade stage: vision only, no tools
+COMPOSITION_SYSTEM_PROMPT = "You are an expert in reading drug compositions from images of tablets and their packaging."
+COMPOSITION_QUERY = "Identify the drug composition printed on this tablet or its packaging. Reply with only the composition (active ingredients and strengths), nothing else. If no composition is legible, reply with UNKNOWN."
+
+# Sections researched together in one concurrent sub-query, once the composition is known
+SECTION_GROUPS = (
+    ("Uses", "How to Use", "Side Effects"),
+    ("Available Tablet Names", "Cost"),
+    ("Safety with Alcohol", "Pregnancy Safety", "Breastfeeding Safety", "Driving Safety", "General Safety Advice"),
+)
+
+# Sections whose answer depends on the tablet's strength, not just its ingredients
+STRENGTH_DEPENDENT_SECTIONS = frozenset(("Available Tablet Names", "How to Use", "Cost"))
+
+RESEARCH_INSTRUCTIONS = "- Return only the sections requested, in the exact *Section:* key-value format given, with no other text."
+
+SECTIONS_QUERY = """
+The drug composition is: {composition}
+Fetch medically accurate information from trusted sources and return ONLY the following sections, in this exact format:
+{section_lines}
+"""
+
+# Research sub-queries in structured output mode ask for the group's slice of RESPONSE_SCHEMA
+JSON_RESEARCH_INSTRUCTIONS = "- Respond with a single JSON object matching the JSON schema given, with every value a plain string and no other text."
+
+JSON_SECTIONS_QUERY = """
+The drug composition is: {composition}
+Fetch medically accurate information from trusted sources and respond with a single JSON object matching this JSON schema:
+{schema}
+"""
+
+ANALYSIS_QUERY = "Extract the drug composition from this tablet image and provide its uses, side effects, cost, available tablet names/brands, usage instructions, and comprehensive safety information including alcohol interactions, pregnancy safety, breastfeeding considerations, and driving safety."
+
+# How the prompts above are assembled into each agent's system message
+SYSTEM_MESSAGE_LAYOUT = "description+instructions"
+
+# Cached results are invalidated automatically whenever the prompts change
+PROMPT_VERSION = content_key(
+    SYSTEM_MESSAGE_LAYOUT, SYSTEM_PROMPT, INSTRUCTIONS, ANALYSIS_QUERY, COMPOSITION_MODEL_ID, COMPOSITION_QUERY, RESEARCH_INSTRUCTIONS,
+    SECTIONS_QUERY
+)[:16]
+STRUCTURED_PROMPT_VERSION = content_key(
+    SYSTEM_MESSAGE_LAYOUT, SYSTEM_PROMPT, JSON_INSTRUCTIONS, ANALYSIS_QUERY, FIELD_REPAIR_QUERY, COMPOSITION_MODEL_ID, COMPOSITION_QUERY,
+    JSON_RESEARCH_INSTRUCTIONS, JSON_SECTIONS_QUERY
+)[:16]
+INTERACTION_PROMPT_VERSION = content_key(
+    SYSTEM_MESSAGE_LAYOUT, MODEL_ID, DRUG_INTERACTION_PROMPT, PAIR_INTERACTION_QUERY
+)[:16]
+
+
+def parse_sections(text):
+    """Tokenize response text into (section name, content) pairs in one pass over the known headers.
+
+    While streaming, the last pair may still be incomplete.
+    """
+    headers = list(SECTION_HEADER_PATTERN.finditer(text))
+    sections = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        sections.append((SECTIONS_BY_NAME[header.group(1).lower()][0], text[header.end():end].strip()))
+    return sections
+
+
+class DrugReport:
+    """Parsed analysis response with one attribute per known section (None when missing)."""
+
+    __slots__ = ("raw",) + tuple(SECTION_FIELDS.values())
+
+    def __init__(self, raw, **sections):
+        self.raw = raw
+        for field in SECTION_FIELDS.values():
+            setattr(self, field, sections.get(field))
+
+    @classmethod
+    @metrics.timed("parse")
+    def parse(cls, text):
+        """Parse response text in a single pass; the first occurrence of a section wins."""
+        sections = {}
+        for section_name, content in parse_sections(text):
+            sections.setdefault(SECTION_FIELDS[section_name], content)
+        return cls(text, **sections)
+
+    @classmethod
+    def from_json(cls, text):
+        """Build a report from a JSON object keyed by section field.
+
+        Returns None if text holds no valid object, or one without any known non-empty field.
+        """
+        # Tolerate code fences or chatter around the object
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end < start:
+            return None
+        try:
+            data = json_loads(text[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        sections = {}
+        for field in SECTION_FIELDS.values():
+            value = data.get(field)
+            if isinstance(value, list):
+                value = ", ".join(str(item) for item in value if item)
+            elif isinstance(value, (int, float)):
+                value = str(value)
+            if isinstance(value, str) and value.strip():
+                sections[field] = value.strip()
+        if not sections:
+            return None
+        return cls(text, **sections)
+
+    def to_text(self):
+        """Render in the canonical *Section:* key-value format understood by parse()."""
+        return "\n".join(f"*{name}:* {content}" for name, content in self.items())
+
+    def get(self, section_name):
+        """Content of a section by display name, e.g. "Side Effects"."""
+        return getattr(self, SECTION_FIELDS[section_name])
+
+    def items(self):
+        """(section name, content) pairs for the sections present, in display order."""
+        return [(name, content) for name, content in ((name, self.get(name)) for name in SECTION_FIELDS) if content]
+
+    def missing(self):
+        """Display names of sections the response did not contain."""
+        return [name for name in SECTION_FIELDS if not self.get(name)]
+
+    def as_dict(self):
+        return dict(self.items())
+
+
+def response_schema(section_names):
+    """The part of RESPONSE_SCHEMA covering only the given sections."""
+    fields = [SECTION_FIELDS[name] for name in section_names]
+    return {
+        "type": "object",
+        "properties": {field: RESPONSE_SCHEMA["properties"][field] for field in fields},
+        "required": fields,
+    }
+
+
+def gemini_model(model_id, api_key):
+    """A Gemini model for one agent.
+
+    phi and google.generativeai take about a second to import, so they are loaded
+    here, on the first analysis, instead of when the app starts.
+    """
+    from phi.model.google import Gemini
+
+    return Gemini(id=model_id, api_key=api_key)
+
+
+def analysis_cache_key(image_bytes, prompt_version=PROMPT_VERSION):
+    """Result cache key for an image under the current model and prompts."""
+    return content_key(image_bytes, MODEL_ID, prompt_version, PREPARE_VERSION)
+
+
+class DrugAnalyzer:
+    """Tablet analysis and interaction checks with result caching; safe to share across threads.
+
+    phi agents keep per-run state, so a fresh agent is built for every call.
+    """
+
+    def __init__(self, google_api_key, tavily_api_key, result_cache=None,
+                 duplicate_index=None, interaction_cache=None, structured_output=STRUCTURED_OUTPUT,
+                 drug_index=None, interaction_matrix=None, search_pool=None, cascade=CASCADE,
+                 composition_model=None, analysis_model=None, section_cache=None, usage_ledger=None,
+                 max_concurrent=4):
+        self.google_api_key = google_api_key
+        self.tavily_api_key = tavily_api_key
+        self.cascade = cascade
+        # Model factories for the two cascade stages; pass fake_models.FakeModel factories to run offline
+        self.composition_model = composition_model or (lambda: gemini_model(COMPOSITION_MODEL_ID, google_api_key))
+        self.analysis_model = analysis_model or (lambda: gemini_model(MODEL_ID, google_api_key))
+        # Researched sections by (composition, section), so another photo of a known drug needs only the first stage
+        self.section_cache = section_cache if section_cache is not None else ResultCache(table="composition_sections")
+        # Separate process-wide budgets, so interaction checks cannot starve image analyses;
+        # MEDISCAN_VISION_CONCURRENCY and MEDISCAN_INTERACTION_CONCURRENCY override max_concurrent
+        self.vision_limiter = limiter_from_env("vision", requests_per_minute=60, max_concurrent=max_concurrent)
+        self.interaction_limiter = limiter_from_env("interaction", requests_per_minute=60, max_concurrent=max_concurrent)
+        # One search cache and HTTP connection pool behind every agent's Tavily tool
+        self.search_pool = search_pool if search_pool is not None else SearchPool(
+            tavily_api_key, limiter=limiter_from_env("search", requests_per_minute=100, max_concurrent=8)
+        )
+        self.structured_output = structured_output
+        # Sessions uploading the same image at once share one agent run
+        self.analysis_flights = SingleFlight()
+        # Attempts run here so a slow call can be hedged or abandoned at its deadline
+        self.hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="mediscan-call")
+        self.latency = {stage: LatencyHistogram() for stage in ("composition", "analysis", "research", "interaction")}
+        self.drug_index = drug_index if drug_index is not None else open_default_index()
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self.duplicate_index = duplicate_index if duplicate_index is not None else NearDuplicateIndex()
+        # Token and tool call totals per day, checked against MEDISCAN_DAILY_TOKEN_BUDGET
+        self.usage_ledger = usage_ledger if usage_ledger is not None else UsageLedger()
+        self.interaction_matrix = interaction_matrix if interaction_matrix is not None else open_default_matrix()
+        self.interaction_engine = InteractionEngine(
+            self.run_interaction_pair,
+            interaction_cache if interaction_cache is not None else ResultCache(table="interaction_pairs"),
+            version=INTERACTION_PROMPT_VERSION,
+            matrix=self.interaction_matrix,
+            normalizer=MedicationNormalizer.from_sources(self.drug_index, self.interaction_matrix),
+        )
+        metrics.register_source("analysis_cache", self.result_cache.stats)
+        metrics.register_source("section_cache", self.section_cache.stats)
+        metrics.register_source("interaction_cache", self.interaction_engine.cache.stats)
+        metrics.register_source("search", self.search_pool.stats)
+        metrics.register_source("usage_today", lambda: self.usage_ledger.day().as_dict())
+        for limiter in (self.vision_limiter, self.interaction_limiter, self.search_pool.limiter):
+            if limiter is not None:
+                metrics.register_source(f"{limiter.name}_limiter", limiter.stats)
+
+    def create_agent(self, instructions=None):
+        """Build the tool-enabled tablet analysis agent, by default with the full-analysis instructions."""
+        from phi.agent import Agent
+
+        if instructions is None:
+            instructions = JSON_INSTRUCTIONS if self.structured_output else INSTRUCTIONS
+        # phi drops instructions when system_prompt is set, so the prompt goes in as the
+        # description and phi builds the system message from it and the instructions
+        return Agent(
+            model=self.analysis_model(),
+            description=SYSTEM_PROMPT,
+            instructions=instructions,
+            tools=[self.search_pool.tools()],
+            tool_call_limit=TOOL_CALL_LIMIT,
+            markdown=not self.structured_output,
+        )
+
+    def create_composition_agent(self):
+        """Build the tool-free agent that only reads the composition off the image."""
+        from phi.agent import Agent
+
+        return Agent(
+            model=self.composition_model(),
+            description=COMPOSITION_SYSTEM_PROMPT,
+        )
+
+    def create_interaction_agent(self):
+        """Build the drug interaction agent."""
+        from phi.agent import Agent
+
+        return Agent(
+            model=self.analysis_model(),
+            description=DRUG_INTERACTION_PROMPT,
+            tools=[self.search_pool.tools()],
+            tool_call_limit=TOOL_CALL_LIMIT,
+            markdown=True,
+        )
+
+    def run_interaction_pair(self, primary, other, deadline=None):
+        """Check a single (primary drug, other medication) pair within the request deadline."""
+        deadline = deadline or Deadline.for_request()
+        query = PAIR_INTERACTION_QUERY.format(primary=primary, other=other)
+        self.usage_ledger.check_budget()
+        with metrics.span("model.interaction"):
+            return hedged_call(
+                self.hedge_executor,
+                lambda hedge: self._run_agent(self.create_interaction_agent(), query),
+                deadline.stage("interaction"),
+                self.latency["interaction"],
+                limiter=self.interaction_limiter,
+            )
+
+    def _run_vision(self, stage, create_agent, query, on_queue=None, deadline=None, **kwargs):
+        """Run a fresh analysis agent within the vision call budget and deadline, hedging slow calls."""
+        deadline = deadline or Deadline.for_request()
+        image_tokens = sum(estimate_image_tokens(image) for image in kwargs.get("images", ()))
+        with metrics.span(f"model.{stage}"):
+            return hedged_call(
+                self.hedge_executor,
+                lambda hedge: self._run_agent(create_agent(), query, image_tokens, **kwargs),
+                deadline.stage("vision"),
+                self.latency[stage],
+                limiter=self.vision_limiter,
+                on_wait=on_queue,
+            )
+
+    def _run_agent(self, agent, query, image_tokens=0, **kwargs):
+        """Run an agent once and record its token and tool call usage; returns the answer text."""
+        response = agent.run(query, **kwargs)
+        usage.record(Usage.from_run(response, image_tokens), self.usage_ledger)
+        return response.content
+
+    def find_similar(self, image_hash, exclude_key=None):
+        """Return (distance, analysis) for a previously analyzed look-alike image, or None.
+
+        Matches stored under exclude_key (usually the image's own cache key) are skipped.
+        Reading the candidates does not count as cache hits or refresh their age.
+        """
+        for distance, result_key in self.duplicate_index.find(image_hash):
+            if result_key == exclude_key:
+                continue
+            cached = self.result_cache.peek(result_key)
+            if cached is not None:
+                return distance, cached
+        return None
+
+    def prompt_version(self):
+        """Version of everything besides the image that an analysis depends on."""
+        prompt_version = STRUCTURED_PROMPT_VERSION if self.structured_output else PROMPT_VERSION
+        if self.drug_index is not None:
+            # Answers drawn from the index go stale when a new dump is loaded
+            prompt_version += self.drug_index.version
+        return prompt_version
+
+    @metrics.timed("analysis")
+    def extract_composition_and_details(self, image_bytes, on_progress=None, on_queue=None, deadline=None,
+                                        on_composition=None):
+        """Extract composition and related drug details from the raw bytes of a tablet image.
+
+        When on_progress is given it is called with the report so far: by the cascade
+        once the composition is read and again as each research group completes, and
+        otherwise with the accumulated text after every streamed chunk (structured
+        output mode without the cascade does not stream). on_composition(composition)
+        is called once the composition is final, before the other sections are done,
+        so dependent work such as an interaction check can start early; it may not be
+        called at all. Concurrent calls for the same image share one agent run. When the call
+        budget is exhausted, on_queue(position, estimated_seconds) reports the wait.
+        Oversized uploads raise image_prep.ImageTooLarge and a used-up daily token
+        budget raises usage.BudgetExceeded. Every model call draws on deadline (a
+        hedging.Deadline for the whole request, by default a fresh one), and
+        DeadlineExceeded is raised once it runs out. Agent errors propagate.
+        """
+        check_upload(image_bytes)
+        deadline = deadline or Deadline.for_request()
+        cache_key = analysis_cache_key(image_bytes, self.prompt_version())
+        try:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            logger.warning("Result cache unavailable: %s", e)
+
+        result, shared = self.analysis_flights.do(
+            cache_key, lambda: self._analyze(image_bytes, cache_key, on_progress, on_queue, deadline, on_composition)
+        )
+        if shared and on_progress is not None:
+            # The streaming went to the session that started the run
+            on_progress(result)
+        return result
+
+    def _analyze(self, image_bytes, cache_key, on_progress, on_queue, deadline, on_composition=None):
+        """Run the agent pipeline for an uncached image and store the result."""
+        self.usage_ledger.check_budget()
+        # Downscaled JPEG bytes go to the model directly, with no temp file round trip
+        with metrics.span("prepare_image"):
+            model_image = prepare_for_model(image_bytes)
+        report = self._run_cascade(model_image, on_queue, deadline, on_progress, on_composition) if self.cascade else None
+        # A report with sections still missing after a failed research group is not cached,
+        # so the next analysis of this image researches them again
+        cacheable = True
+        if report is not None:
+            result = report.to_text()
+            cacheable = not report.missing()
+        elif self.structured_output:
+            result = self._run_structured(model_image, on_queue, deadline)
+        elif on_progress is None:
+            result = self._run_vision(
+                "analysis", self.create_agent, ANALYSIS_QUERY, on_queue, deadline, images=[model_image]
+            ).strip()
+        else:
+            # Stream tokens so callers can render sections while the model is still writing
+            image_tokens = estimate_image_tokens(model_image)
+
+            def stream(hedge):
+                chunks = []
+                composition = None
+                agent = self.create_agent()
+                for chunk in agent.run(ANALYSIS_QUERY, images=[model_image], stream=True):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        # Only the primary attempt drives the live view
+                        if hedge:
+                            continue
+                        text = "".join(chunks)
+                        on_progress(text)
+                        if composition is None and on_composition is not None:
+                            # Every section followed by another header is final
+                            composition = dict(parse_sections(text)[:-1]).get("Composition")
+                            if composition:
+                                on_composition(composition)
+                # The agent totals the streamed run's metrics once the stream ends
+                usage.record(Usage.from_run(agent.run_response, image_tokens), self.usage_ledger)
+                return "".join(chunks)
+
+            with metrics.span("model.analysis"):
+                result = hedged_call(
+                    self.hedge_executor, stream, deadline.stage("vision"), self.latency["analysis"],
+                    limiter=self.vision_limiter, on_wait=on_queue,
+                ).strip()
+
+        if result and cacheable:
+            try:
+                self.result_cache.set(cache_key, result)
+                self.duplicate_index.add(dhash(image_bytes), cache_key)
+            except Exception as e:
+                logger.warning("Could not cache analysis: %s", e)
+        return result
+
+    def _run_cascade(self, model_image, on_queue=None, deadline=None, on_progress=None, on_composition=None):
+        """Read the composition with the cheap model, then fill in sections from the cheapest source.
+
+        Sources in order: sections cached for the same composition, the offline drug
+        index, and finally concurrent web-search sub-queries (one per SECTION_GROUPS
+        group) for whatever is still missing. The composition is reported as soon as
+        it is read, and the report so far after each stage. Returns the DrugReport, or
+        None when no composition could be read, so the caller falls back to a full
+        analysis of the image.
+        """
+        composition = self._run_vision(
+            "composition", self.create_composition_agent, COMPOSITION_QUERY, on_queue, deadline, images=[model_image]
+        ).strip()
+        ingredients = ingredient_key(composition)
+        if not ingredients or ingredients == "unknown":
+            return None
+
+        report = DrugReport(None)
+        entry = self.drug_index.lookup(composition) if self.drug_index is not None else None
+        for name, field in SECTION_FIELDS.items():
+            if name == "Composition":
+                continue
+            cached = self.section_cache.get(self._section_key(composition, name))
+            setattr(report, field, cached if cached is not None else (entry or {}).get(field))
+        # The strengths actually read off this tablet
+        report.composition = composition
+        if on_composition is not None:
+            on_composition(composition)
+        if on_progress is not None:
+            on_progress(report.to_text())
+
+        missing = report.missing()
+        groups = [[name for name in group if name in missing] for group in SECTION_GROUPS]
+        groups = [group for group in groups if group]
+        if groups:
+            self._research_sections(report, groups, on_queue, deadline, on_progress)
+        return report
+
+    def _section_key(self, composition, section_name):
+        """Section cache key: strength-dependent sections are shared only by tablets of the same strengths."""
+        if section_name in STRENGTH_DEPENDENT_SECTIONS:
+            composition = composition_key(composition)
+        else:
+            composition = ingredient_key(composition)
+        return content_key("section", MODEL_ID, self.prompt_version(), composition, section_name)
+
+    def _research_sections(self, report, groups, on_queue=None, deadline=None, on_progress=None):
+        """Research groups of missing sections concurrently, filling and caching them in report.
+
+        on_progress gets the report so far as each group completes. A failed group
+        leaves its sections empty; if every group fails the first error is raised.
+        """
+        def research(group):
+            if self.structured_output:
+                query = JSON_SECTIONS_QUERY.format(
+                    composition=report.composition, schema=json.dumps(response_schema(group), indent=2)
+                )
+                raw = self._run_vision(
+                    "research", lambda: self.create_agent(JSON_RESEARCH_INSTRUCTIONS), query, on_queue, deadline
+                )
+                # Fall back to the key-value parser if the model ignored the schema
+                return DrugReport.from_json(raw) or DrugReport.parse(raw)
+            query = SECTIONS_QUERY.format(
+                composition=report.composition,
+                section_lines="\n".join(f"*{name}:* <{name.lower()}>" for name in group),
+            )
+            return DrugReport.parse(
+                self._run_vision("research", lambda: self.create_agent(RESEARCH_INSTRUCTIONS), query, on_queue, deadline)
+            )
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            futures = {usage.submit(pool, research, group): group for group in groups}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    researched = future.result()
+                except Exception as e:
+                    logger.warning("Could not research %s: %s", ", ".join(group), e)
+                    errors.append(e)
+                    continue
+                for name in group:
+                    content = getattr(researched, SECTION_FIELDS[name])
+                    setattr(report, SECTION_FIELDS[name], content)
+                    if content:
+                        self.section_cache.set(self._section_key(report.composition, name), content)
+                if on_progress is not None:
+                    on_progress(report.to_text())
+        if len(errors) == len(futures):
+            raise errors[0]
+
+    def _run_structured(self, model_image, on_queue=None, deadline=None):
+        """Run the JSON-mode analysis, re-prompting only for fields that came back missing."""
+        raw = self._run_vision("analysis", self.create_agent, ANALYSIS_QUERY, on_queue, deadline, images=[model_image])
+        report = DrugReport.from_json(raw)
+        if report is None:
+            # The model ignored the schema entirely; fall back to the key-value parser
+            logger.warning("Structured response was not valid JSON; using the key-value parser")
+            report = DrugReport.parse(raw)
+
+        missing = report.missing()
+        if missing:
+            query = FIELD_REPAIR_QUERY.format(
+                composition=report.composition or "unknown",
+                fields=", ".join(SECTION_FIELDS[name] for name in missing),
+            )
+            patch = DrugReport.from_json(
+                self._run_vision("research", self.create_agent, query, on_queue, deadline, images=[model_image])
+            )
+            if patch is not None:
+                for name in missing:
+                    field = SECTION_FIELDS[name]
+                    setattr(report, field, getattr(patch, field))
+        return report.to_text()
+
+    @metrics.timed("interactions")
+    def analyze_drug_interactions(self, drug_composition, additional_medications, deadline=None):
+        """Check the composition against each additional medication, or None if there are none.
+
+        Pass the deadline of the analysis this check belongs to, so both share one budget.
+        """
+        if not additional_medications.strip():
+            return None
+        # Each (drug, medication) pair is cached, so only new medications reach the agent
+        return self.interaction_engine.analyze(
+            drug_composition, additional_medications, deadline=deadline or Deadline.for_request()
+        )
@@ -0,0 +1,241 @@
+"""Offline drug knowledge index (SQLite FTS5) used before falling back to web search.
+
+Load a dump once, then point the app at the resulting database:
+    python drug_index.py load drugs.csv
+    python drug_index.py search crocin
+
+CSV/JSON records use the DrugReport field names as columns/keys: composition,
+tablet_names (brand and generic names; a list in JSON), uses, how_to_use,
+side_effects, cost, alcohol_safety, pregnancy_safety, breastfeeding_safety,
+driving_safety and general_safety. Any of the monograph fields may be left empty.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+
+DEFAULT_INDEX_PATH = os.environ.get("MEDISCAN_DRUG_INDEX_PATH", ".mediscan_drugs.sqlite3")
+
+MONOGRAPH_FIELDS = (
+    "uses", "how_to_use", "side_effects", "cost", "alcohol_safety", "pregnancy_safety",
+    "breastfeeding_safety", "driving_safety", "general_safety",
+)
+
+_STRENGTH = re.compile(r"\b\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|iu|%)(?![a-z])", re.IGNORECASE)
+_NOISE = re.compile(r"\b(?:ip|bp|usp|tablets?|tabs?)\b|[^\w\s-]", re.IGNORECASE)
+_INGREDIENT_SEPARATORS = re.compile(r"\s*(?:\+|,|/|&|;|\band\b|\bwith\b)\s*", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_FTS_TOKEN = re.compile(r"\w+")
+_BRAND_SEPARATORS = re.compile(r"\s*[,;/]\s*")
+_BARE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def _ingredient_name(part):
+    part = _NOISE.sub(" ", _STRENGTH.sub(" ", part))
+    return _WHITESPACE.sub(" ", part).strip(" -").casefold()
+
+
+def split_ingredients(composition):
+    """Sorted, unique, lower-case ingredient names of a composition, without strengths."""
+    ingredients = set()
+    for part in _INGREDIENT_SEPARATORS.split(composition or ""):
+        part = _ingredient_name(part)
+        if part:
+            ingredients.add(part)
+    return sorted(ingredients)
+
+
+def ingredient_key(composition):
+    """Canonical key for a composition, e.g. "caffeine+paracetamol"."""
+    return "+".join(split_ingredients(composition))
+
+
+def composition_key(composition):
+    """Canonical key that keeps strengths, e.g. "caffeine 65mg+paracetamol 500mg"."""
+    ingredients = set()
+    for part in _INGREDIENT_SEPARATORS.split(composition or ""):
+        name = _ingredient_name(part)
+        if name:
+            strengths = " ".join(_WHITESPACE.sub("", strength).casefold() for strength in _STRENGTH.findall(part))
+            ingredients.add(f"{name} {strengths}".strip())
+    return "+".join(sorted(ingredients))
+
+
+def brand_key(name):
+    """Canonical key for a brand name without its strength, e.g. "Brufen 400" -> "brufen"."""
+    name = _BARE_NUMBER.sub(" ", _NOISE.sub(" ", _STRENGTH.sub(" ", name or "")))
+    return _WHITESPACE.sub(" ", name).strip(" -").casefold()
+
+
+class DrugIndex:
+    """Drug monographs keyed by canonical composition, with full-text search over names."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS drugs ("
+            "id INTEGER PRIMARY KEY, ingredient_key TEXT UNIQUE NOT NULL, "
+            "composition TEXT NOT NULL, tablet_names TEXT, "
+            + ", ".join(f"{field} TEXT" for field in MONOGRAPH_FIELDS) + ");"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS drugs_fts USING fts5("
+            "composition, tablet_names, content='drugs', content_rowid='id');"
+            "CREATE TABLE IF NOT EXISTS brands ("
+            "brand_key TEXT NOT NULL, drug_id INTEGER NOT NULL, PRIMARY KEY (brand_key, drug_id));"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        with self._lock:
+            unkeyed = self._conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM drugs) AND NOT EXISTS (SELECT 1 FROM brands)"
+            ).fetchone()[0]
+            if unkeyed:
+                # Index built before brand names were keyed
+                self._rebuild_brands()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM drugs").fetchone()[0]
+
+    @property
+    def version(self):
+        """Changes on every load, so results derived from the index can be invalidated."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else ""
+
+    def add_records(self, records):
+        """Insert or replace records (dicts keyed by field name) and return how many were stored."""
+        columns = ("ingredient_key", "composition", "tablet_names") + MONOGRAPH_FIELDS
+        rows = []
+        for record in records:
+            key = ingredient_key(record.get("composition"))
+            if not key:
+                continue
+            names = record.get("tablet_names") or ""
+            if isinstance(names, list):
+                names = ", ".join(names)
+            rows.append((key, record["composition"].strip(), names.strip())
+                        + tuple((record.get(field) or "").strip() or None for field in MONOGRAPH_FIELDS))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO drugs ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    rows,
+                )
+                self._conn.execute("INSERT INTO drugs_fts(drugs_fts) VALUES ('rebuild')")
+                self._rebuild_brands()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (uuid.uuid4().hex,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _rebuild_brands(self):
+        """Re-key every brand name to its drug row; the caller holds the lock."""
+        rows = set()
+        for drug_id, names in self._conn.execute("SELECT id, tablet_names FROM drugs").fetchall():
+            for name in _BRAND_SEPARATORS.split(names or ""):
+                key = brand_key(name)
+                if key:
+                    rows.add((key, drug_id))
+        self._conn.execute("DELETE FROM brands")
+        self._conn.executemany("INSERT INTO brands (brand_key, drug_id) VALUES (?, ?)", rows)
+
+    def load(self, dump_path):
+        """Load a CSV or JSON (list of objects) dump."""
+        with open(dump_path, encoding="utf-8", newline="") as dump_file:
+            if dump_path.lower().endswith(".json"):
+                return self.add_records(json.load(dump_file))
+            return self.add_records(csv.DictReader(dump_file))
+
+    def _entry(self, row):
+        entry = {"composition": row["composition"], "tablet_names": row["tablet_names"]}
+        entry.update((field, row[field]) for field in MONOGRAPH_FIELDS)
+        return {field: value for field, value in entry.items() if value}
+
+    def lookup(self, composition):
+        """Return the monograph for a composition (or a brand name), or None.
+
+        Only exact ingredient-set or whole brand-name matches count (strengths ignored),
+        so "paracetamol + caffeine" never resolves to plain paracetamol or vice versa.
+        """
+        key = ingredient_key(composition)
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM drugs WHERE ingredient_key = ?", (key,)).fetchone()
+            if row is None:
+                # The label may show a brand name instead of the generic composition. Brands
+                # are matched whole, so a brand shared by several compositions resolves to none.
+                rows = self._conn.execute(
+                    "SELECT drugs.* FROM brands JOIN drugs ON drugs.id = brands.drug_id "
+                    "WHERE brands.brand_key = ? LIMIT 2",
+                    (brand_key(composition),),
+                ).fetchall()
+                row = rows[0] if len(rows) == 1 else None
+        return self._entry(row) if row is not None else None
+
+    def names(self):
+        """(composition, tablet names) for every indexed drug."""
+        with self._lock:
+            return self._conn.execute("SELECT composition, tablet_names FROM drugs").fetchall()
+
+    def search(self, text, limit=10):
+        """Prefix search over compositions and brand names, best matches first."""
+        tokens = _FTS_TOKEN.findall(text)
+        if not tokens:
+            return []
+        query = " ".join(f'"{token}"*' for token in tokens)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT drugs.* FROM drugs_fts JOIN drugs ON drugs.id = drugs_fts.rowid "
+                "WHERE drugs_fts MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit),
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+
+def open_default_index():
+    """Open the configured index if it exists and holds data, else None."""
+    if not os.path.exists(DEFAULT_INDEX_PATH):
+        return None
+    index = DrugIndex(DEFAULT_INDEX_PATH)
+    return index if len(index) else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the offline drug knowledge index.")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="SQLite index path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load_parser = commands.add_parser("load", help="load a CSV or JSON dump")
+    load_parser.add_argument("dumps", nargs="+")
+    search_parser = commands.add_parser("search", help="search compositions and brand names")
+    search_parser.add_argument("text")
+    args = parser.parse_args(argv)
+
+    index = DrugIndex(args.index)
+    if args.command == "load":
+        for dump_path in args.dumps:
+            print(f"{dump_path}: {index.load(dump_path)} records")
+        print(f"{len(index)} drugs indexed in {args.index}")
+    else:
+        for entry in index.search(args.text):
+            print(f"{entry['composition']}: {entry.get('tablet_names', '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Offline stand-ins for Gemini and Tavily, for trying or benchmarking the pipeline without API keys.
+
+    analyzer = DrugAnalyzer("unused", "unused",
+                            composition_model=lambda: FakeModel(latency=0.2),
+                            analysis_model=lambda: FakeModel(latency=2.0, searches=2),
+                            search_pool=SearchPool("unused", client=FakeSearchClient(latency=0.5)))
+"""
+import json
+import random
+import re
+import time
+from typing import Callable, Iterator, List, Optional
+
+from phi.model.base import Model
+from phi.model.message import Message
+from phi.model.response import ModelResponse
+
+from core import SECTION_FIELDS, SECTIONS
+
+FAKE_COMPOSITION = "Paracetamol 500mg"
+_REQUESTED_SECTION = re.compile(r"^\*([^*:]+):\*", re.MULTILINE)
+_SEARCH_TOOL = "web_search_using_tavily"
+# Rough characters per token, for plausible usage metrics
+_CHARS_PER_TOKEN = 4
+
+
+def _section_text(name):
+    return FAKE_COMPOSITION if name == "Composition" else f"Sample {name.lower()} for {FAKE_COMPOSITION}."
+
+
+def requested_sections(messages):
+    """Section names a cascade research prompt in the last user message asks for, in order."""
+    return _REQUESTED_SECTION.findall(messages[-1].get_content_string())
+
+
+def canned_reply(messages):
+    """A plausible answer to whichever MediScan prompt the last user message holds."""
+    query = messages[-1].get_content_string()
+    system = messages[0].get_content_string() if messages[0].role == "system" else ""
+    if "Reply with only the composition" in query:
+        return FAKE_COMPOSITION
+    if "Primary Drug:" in query:
+        return "**Minor interaction.** No dose adjustment is usually needed."
+    requested = requested_sections(messages)
+    if requested:
+        return "\n".join(f"*{name}:* {_section_text(name)}" for name in requested)
+    if "JSON" in system or "JSON" in query:
+        return json.dumps({field: _section_text(name) for name, field in SECTION_FIELDS.items()})
+    return "\n".join(f"*{name}:* {_section_text(name)}" for name, _, _ in SECTIONS)
+
+
+def sample_latency(median, sigma, rng=random):
+    """Log-normal latency around median seconds; sigma 0 gives a fixed delay."""
+    if median <= 0:
+        return 0.0
+    return median * rng.lognormvariate(0.0, sigma) if sigma else median
+
+
+class FakeModel(Model):
+    """phi Model that answers from a function after a simulated delay, without network calls.
+
+    With searches > 0 it also calls the agent's Tavily tool that many times per
+    answer, so the search cache, rate limiter and fake client are exercised too.
+    Answers are recorded with estimated token counts, like Gemini's usage metadata.
+    """
+
+    id: str = "fake-model"
+    name: str = "FakeModel"
+    provider: str = "Fake"
+    latency: float = 0.0
+    latency_sigma: float = 0.0
+    searches: int = 0
+    reply: Optional[Callable[[List[Message]], str]] = None
+    calls: int = 0
+
+    def _answer(self, messages):
+        self.calls += 1
+        search = self.functions.get(_SEARCH_TOOL) if self.functions else None
+        if search is not None:
+            topic = messages[-1].get_content_string()[:80]
+            for index in range(self.searches):
+                result = search.entrypoint(query=f"{topic} {index}")
+                # Recorded like a real tool call, so usage accounting counts it
+                messages.append(Message(role="tool", content=str(result), tool_name=_SEARCH_TOOL))
+        time.sleep(sample_latency(self.latency, self.latency_sigma))
+        text = (self.reply or canned_reply)(messages)
+        prompt = sum(len(message.get_content_string()) for message in messages)
+        # The agent totals run metrics from the assistant messages it finds here
+        messages.append(Message(role="assistant", content=text, metrics={
+            "input_tokens": prompt // _CHARS_PER_TOKEN,
+            "output_tokens": len(text) // _CHARS_PER_TOKEN,
+        }))
+        return text
+
+    def response(self, messages: List[Message]) -> ModelResponse:
+        return ModelResponse(content=self._answer(messages))
+
+    def response_stream(self, messages: List[Message]) -> Iterator[ModelResponse]:
+        text = self._answer(messages)
+        for line in text.splitlines(keepends=True):
+            yield ModelResponse(content=line)
+
+
+class FakeSearchClient:
+    """Stands in for TavilyClient: canned results after a simulated delay."""
+
+    def __init__(self, latency=0.0, latency_sigma=0.0):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.calls = 0
+
+    def search(self, query, max_results=5, **kwargs):
+        self.calls += 1
+        time.sleep(sample_latency(self.latency, self.latency_sigma))
+        return {
+            "query": query,
+            "answer": f"Summary for {query}.",
+            "results": [
+                {"title": f"Result {rank}", "url": f"https://example.org/{rank}", "content": f"About {query}.",
+                 "score": 1.0 / rank}
+                for rank in range(1, max_results + 1)
+            ],
+        }
@@ -0,0 +1,135 @@
+"""Deadline budgets and hedged calls for long-tailed model latency.
+
+A request gets a total deadline split into per-stage budgets. Within a stage, a
+call that runs longer than a chosen percentile of recent latencies is duplicated
+and whichever attempt answers first wins.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import metrics
+import usage
+
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("MEDISCAN_DEADLINE_SECONDS", 120))
+# Fractions of the request deadline. The vision and interaction stages may run back
+# to back; each search runs inside one of them and gets a per-call cap.
+STAGE_SHARES = {"vision": 0.7, "interaction": 0.3, "search": 0.15}
+HEDGE_PERCENTILE = float(os.environ.get("MEDISCAN_HEDGE_PERCENTILE", 95))
+# No hedging until a stage has this many observations
+MIN_SAMPLES = 20
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage ran out of its time budget."""
+
+
+class Deadline:
+    """Wall-clock budget that several calls draw down in turn."""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def for_request(cls, total=None):
+        """The whole budget of one request, drawn down by every stage run for it."""
+        return cls(total if total is not None else REQUEST_DEADLINE_SECONDS)
+
+    def stage(self, stage, total=None):
+        """Deadline for one stage: its share of the request budget, or less if the request has less left."""
+        share = (total if total is not None else REQUEST_DEADLINE_SECONDS) * STAGE_SHARES[stage]
+        return Deadline(min(share, self.remaining()))
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class LatencyHistogram:
+    """Rolling window of call latencies, in seconds."""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the window, or None while it holds too few samples."""
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+
+def hedged_call(executor, fn, deadline, histogram=None, percentile=HEDGE_PERCENTILE, limiter=None, on_wait=None):
+    """Run fn(hedge) on executor, racing a duplicate fn(True) if the first is slow.
+
+    The primary attempt is called with hedge=False. Once it has run longer than the
+    histogram's percentile, a second attempt starts and the first successful answer
+    is returned. An attempt that fails is ignored while another is still running.
+    Raises DeadlineExceeded when no attempt answers in time; attempts that lose or
+    time out are left to finish in the background.
+
+    With a rate_limit.RateLimiter, the primary attempt queues for a slot (reporting
+    through on_wait, and for no longer than the deadline) and a hedge only starts if
+    a slot is free at once. Every attempt holds its slot until it actually finishes,
+    even after being abandoned, so hedging never exceeds the limiter's caps.
+    """
+    def attempt(hedge, admitted):
+        try:
+            return fn(hedge)
+        finally:
+            if limiter is not None:
+                limiter.release(admitted)
+
+    admitted = None
+    if limiter is not None:
+        admitted = limiter.acquire(on_wait, timeout=deadline.remaining())
+        if admitted is None:
+            metrics.increment("deadline_exceeded")
+            raise DeadlineExceeded("No call slot became free within the time budget")
+    started = time.monotonic()
+    attempts = [usage.submit(executor, attempt, False, admitted)]
+    hedge_after = histogram.percentile(percentile) if histogram is not None else None
+    error = None
+    while attempts:
+        timeout = deadline.remaining()
+        hedging = hedge_after is not None and len(attempts) == 1 and error is None
+        if hedging:
+            timeout = min(timeout, max(0.0, started + hedge_after - time.monotonic()))
+        done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            attempts.remove(future)
+            if future.exception() is None:
+                if histogram is not None:
+                    histogram.record(time.monotonic() - started)
+                return future.result()
+            error = future.exception()
+        if done:
+            continue
+        if deadline.expired:
+            metrics.increment("deadline_exceeded")
+            raise DeadlineExceeded(f"No answer within the time budget ({time.monotonic() - started:.1f}s)")
+        if hedging:
+            hedge_after = None
+            admitted = limiter.try_acquire() if limiter is not None else None
+            if limiter is not None and admitted is None:
+                # Others are waiting for the budget a duplicate call would take
+                metrics.increment("hedges_skipped")
+                continue
+            metrics.increment("hedged_calls")
+            attempts.append(usage.submit(executor, attempt, True, admitted))
+    raise error
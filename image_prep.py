@@ -0,0 +1,129 @@
+"""Decode, orient, downscale and re-encode uploads before they are sent to the model."""
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+
+import metrics
+
+MAX_MODEL_IMAGE_EDGE = int(os.environ.get("MEDISCAN_MAX_IMAGE_EDGE", 1600))
+MODEL_IMAGE_BYTE_BUDGET = int(os.environ.get("MEDISCAN_IMAGE_BYTE_BUDGET", 400_000))
+MIN_JPEG_QUALITY = 50
+MAX_JPEG_QUALITY = 90
+# Uploads past these are rejected before any decoding or model call
+MAX_UPLOAD_BYTES = int(os.environ.get("MEDISCAN_MAX_UPLOAD_BYTES", 20_000_000))
+MAX_UPLOAD_PIXELS = int(os.environ.get("MEDISCAN_MAX_UPLOAD_PIXELS", 50_000_000))
+# Below this edge strip text stops being legible, so the byte budget is allowed to overflow
+MIN_MODEL_IMAGE_EDGE = 640
+
+# WebP thumbnails are much smaller than PNG; fall back to JPEG if Pillow lacks WebP
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_QUALITY = 85
+
+# Part of the analysis cache key: results depend on what the model actually saw
+PREPARE_VERSION = f"jpeg:{MAX_MODEL_IMAGE_EDGE}:{MODEL_IMAGE_BYTE_BUDGET}"
+
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLarge(ValueError):
+    """An upload exceeds MAX_UPLOAD_BYTES or MAX_UPLOAD_PIXELS."""
+
+
+def check_upload(image_bytes, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS):
+    """Raise ImageTooLarge for uploads too big to analyze; only the image header is read."""
+    if len(image_bytes) > max_bytes:
+        raise ImageTooLarge(f"The image is {len(image_bytes) / 1e6:.1f} MB; the limit is {max_bytes / 1e6:.0f} MB.")
+    width, height = Image.open(BytesIO(image_bytes)).size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"The image is {width}x{height} pixels; the limit is {max_pixels / 1e6:.0f} megapixels.")
+
+
+def _encode_jpeg(img, quality, optimize=True):
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=optimize)
+    return buf.getvalue()
+
+
+def _encode_within_budget(img, byte_budget):
+    """Highest-quality JPEG encoding that fits the budget, or None if none does."""
+    # Search with plain encodes, about three times faster, and optimize only the winner
+    low, high = MIN_JPEG_QUALITY, MAX_JPEG_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        if len(_encode_jpeg(img, quality, optimize=False)) <= byte_budget:
+            best = quality
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        return None
+    encoded = _encode_jpeg(img, best)
+    # Optimized Huffman tables practically never grow the file, but the budget is a promise
+    return encoded if len(encoded) <= byte_budget else _encode_jpeg(img, best, optimize=False)
+
+
+def _to_rgb(img):
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        # Flatten transparency onto white so packaging text keeps its contrast
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def prepare_for_model(image_bytes, max_edge=MAX_MODEL_IMAGE_EDGE, byte_budget=MODEL_IMAGE_BYTE_BUDGET):
+    """Return JPEG bytes no larger than max_edge on either side, aiming for byte_budget."""
+    img = Image.open(BytesIO(image_bytes))
+
+    # Already small, upright JPEGs are sent untouched
+    if (img.format == "JPEG" and max(img.size) <= max_edge and len(image_bytes) <= byte_budget
+            and img.getexif().get(_EXIF_ORIENTATION, 1) == 1):
+        return image_bytes
+
+    # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale. The target keeps the
+    # aspect ratio (a square one would hold a 4:3 photo at full size), and a quarter turn
+    # from EXIF leaves the long edge long, so it still reaches max_edge.
+    width, height = img.size
+    long_edge = max(width, height)
+    if long_edge > max_edge:
+        img.draft("RGB", (max(1, width * max_edge // long_edge), max(1, height * max_edge // long_edge)))
+    img = _to_rgb(ImageOps.exif_transpose(img))
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    while True:
+        encoded = _encode_within_budget(img, byte_budget)
+        if encoded is not None:
+            return encoded
+        if max(img.size) <= MIN_MODEL_IMAGE_EDGE:
+            return _encode_jpeg(img, MIN_JPEG_QUALITY)
+        scale = max(0.75, MIN_MODEL_IMAGE_EDGE / max(img.size))
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.Resampling.LANCZOS)
+
+
+@metrics.timed("thumbnail")
+def make_thumbnail(image_bytes, width, image_format=THUMBNAIL_FORMAT):
+    """Return a display thumbnail of the given width, encoded as WebP or JPEG."""
+    img = Image.open(BytesIO(image_bytes))
+    # Orientations 5-8 are stored a quarter turn from upright, so the displayed width is the stored height
+    turned = img.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+    display_width, display_height = img.size[::-1] if turned else img.size
+    target = (width, max(1, width * display_height // display_width))
+    # Let libjpeg decode straight to the smallest scale that still covers the target
+    img.draft("RGB", target[::-1] if turned else target)
+    img = ImageOps.exif_transpose(img)
+    if image_format == "JPEG" or img.mode not in ("RGB", "RGBA"):
+        img = _to_rgb(img)
+
+    height = max(1, round(width * img.height / img.width))
+    # Cheap integer box reduction first, leaving 2x headroom for the final LANCZOS pass
+    factor = min(img.width // (width * 2), img.height // (height * 2))
+    if factor > 1:
+        img = img.reduce(factor)
+    img = img.resize((width, height), Image.Resampling.LANCZOS)
+
+    buf = BytesIO()
+    img.save(buf, format=image_format, quality=THUMBNAIL_QUALITY)
+    return buf.getvalue()
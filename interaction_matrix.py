@@ -0,0 +1,134 @@
+"""Precomputed drug-drug interaction table for instant, offline severity lookups.
+
+The data file is a CSV with the columns drug_a, drug_b, severity, mechanism and
+recommendation, where severity is one of None, Minor, Moderate, Major or Severe.
+Drug names are matched on the canonical ingredient name, so "Aspirin 75mg" and
+"aspirin" share an entry, and each pair is stored once regardless of order.
+"""
+import csv
+import os
+from array import array
+
+from drug_index import split_ingredients
+
+DEFAULT_MATRIX_PATH = os.environ.get("MEDISCAN_INTERACTIONS_PATH", "interactions.csv")
+
+SEVERITY_LEVELS = ("None", "Minor", "Moderate", "Major", "Severe")
+_SEVERITY_CODES = {level.lower(): code for code, level in enumerate(SEVERITY_LEVELS)}
+
+
+class InteractionMatrix:
+    """Sparse symmetric ingredient x ingredient table over interned integer ids."""
+
+    def __init__(self):
+        self._ids = {}
+        # Packed (low id, high id) -> row in the parallel columns below
+        self._pairs = {}
+        self._severity = array("B")
+        self._mechanism = []
+        self._recommendation = []
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def ingredient_names(self):
+        """Every canonical ingredient that appears in the table."""
+        return list(self._ids)
+
+    def _intern(self, name):
+        return self._ids.setdefault(name, len(self._ids))
+
+    @staticmethod
+    def _pair_key(id_a, id_b):
+        low, high = (id_a, id_b) if id_a <= id_b else (id_b, id_a)
+        return (low << 32) | high
+
+    def add(self, drug_a, drug_b, severity, mechanism="", recommendation=""):
+        """Add or replace the entry for a single-ingredient pair."""
+        names = split_ingredients(drug_a), split_ingredients(drug_b)
+        if len(names[0]) != 1 or len(names[1]) != 1:
+            raise ValueError(f"Interaction entries need single ingredients: {drug_a!r}, {drug_b!r}")
+        code = _SEVERITY_CODES.get(severity.strip().lower())
+        if code is None:
+            raise ValueError(f"Unknown severity {severity!r}; expected one of {', '.join(SEVERITY_LEVELS)}")
+        key = self._pair_key(self._intern(names[0][0]), self._intern(names[1][0]))
+        row = self._pairs.get(key)
+        if row is None:
+            self._pairs[key] = len(self._severity)
+            self._severity.append(code)
+            self._mechanism.append(mechanism.strip())
+            self._recommendation.append(recommendation.strip())
+        else:
+            self._severity[row] = code
+            self._mechanism[row] = mechanism.strip()
+            self._recommendation[row] = recommendation.strip()
+
+    def load_csv(self, path):
+        """Load entries from a CSV data file and return how many were read."""
+        count = 0
+        with open(path, encoding="utf-8", newline="") as data_file:
+            for record in csv.DictReader(data_file):
+                self.add(record["drug_a"], record["drug_b"], record["severity"],
+                         record.get("mechanism") or "", record.get("recommendation") or "")
+                count += 1
+        return count
+
+    def lookup(self, ingredient_a, ingredient_b):
+        """Return (severity, mechanism, recommendation) for two canonical ingredients, or None."""
+        id_a, id_b = self._ids.get(ingredient_a), self._ids.get(ingredient_b)
+        if id_a is None or id_b is None:
+            return None
+        row = self._pairs.get(self._pair_key(id_a, id_b))
+        if row is None:
+            return None
+        return SEVERITY_LEVELS[self._severity[row]], self._mechanism[row], self._recommendation[row]
+
+    def describe(self, primary, medication):
+        """Markdown interaction summary for two drugs, or None if any ingredient pair is unknown."""
+        parts = []
+        for ingredient_a in split_ingredients(primary):
+            for ingredient_b in split_ingredients(medication):
+                if ingredient_a == ingredient_b:
+                    continue
+                entry = self.lookup(ingredient_a, ingredient_b)
+                if entry is None:
+                    return None
+                severity, mechanism, recommendation = entry
+                lines = [f"**{ingredient_a.title()} + {ingredient_b.title()}: {severity} interaction**"]
+                if mechanism:
+                    lines.append(f"Mechanism: {mechanism}")
+                if recommendation:
+                    lines.append(f"Recommendation: {recommendation}")
+                parts.append("\n\n".join(lines))
+        return "\n\n".join(parts) or None
+
+    def grid(self, ingredients):
+        """Pairwise severity grid: a k x k list of lists with None for unknown pairs."""
+        ids = [self._ids.get(name) for name in ingredients]
+        grid = []
+        for i, id_a in enumerate(ids):
+            row = []
+            for j, id_b in enumerate(ids):
+                severity = None
+                if i != j and id_a is not None and id_b is not None:
+                    entry = self._pairs.get(self._pair_key(id_a, id_b))
+                    if entry is not None:
+                        severity = SEVERITY_LEVELS[self._severity[entry]]
+                row.append(severity)
+            grid.append(row)
+        return grid
+
+
+def max_severity(grid):
+    """Highest known severity in a grid, or None if no pair is known."""
+    codes = [_SEVERITY_CODES[cell.lower()] for row in grid for cell in row if cell]
+    return SEVERITY_LEVELS[max(codes)] if codes else None
+
+
+def open_default_matrix():
+    """Load the configured interaction data file if it exists, else None."""
+    if not os.path.exists(DEFAULT_MATRIX_PATH):
+        return None
+    matrix = InteractionMatrix()
+    matrix.load_csv(DEFAULT_MATRIX_PATH)
+    return matrix
@@ -0,0 +1,140 @@
+"""Pairwise, memoized drug interaction analysis."""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from drug_index import split_ingredients
+from med_normalizer import Medication
+from result_cache import content_key
+from singleflight import SingleFlight
+import usage
+
+DEFAULT_MAX_WORKERS = 4
+
+_MED_SEPARATORS = re.compile(r"[,;\n]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def interaction_ingredients(primary, medications):
+    """Unique canonical ingredients of the primary drug followed by those of each medication."""
+    ingredients = split_ingredients(primary)
+    for medication in medications:
+        ingredients.extend(name for name in split_ingredients(medication) if name not in ingredients)
+    return ingredients
+
+
+def canonical_name(name):
+    """Normalize a drug name so trivially different spellings share a cache entry."""
+    return _WHITESPACE.sub(" ", name).strip(" .").casefold()
+
+
+def split_medications(medications_text):
+    """Split a free-text medication list into unique entries, keeping input order."""
+    seen = set()
+    medications = []
+    for entry in _MED_SEPARATORS.split(medications_text or ""):
+        entry = _WHITESPACE.sub(" ", entry).strip(" .")
+        if entry and canonical_name(entry) not in seen:
+            seen.add(canonical_name(entry))
+            medications.append(entry)
+    return medications
+
+
+class InteractionEngine:
+    """Checks a primary drug against each other medication, one cached LLM call per pair."""
+
+    def __init__(self, run_pair, cache, version="", max_workers=DEFAULT_MAX_WORKERS, matrix=None,
+                 normalizer=None):
+        # run_pair(primary, other, deadline) -> interaction text; must be safe to call from threads
+        self.run_pair = run_pair
+        self.cache = cache
+        self.version = version
+        self.max_workers = max_workers
+        # Optional InteractionMatrix; pairs it fully covers never reach the agent
+        self.matrix = matrix
+        # Optional MedicationNormalizer resolving spellings and brands to canonical ingredients
+        self.normalizer = normalizer
+        self.flights = SingleFlight()
+
+    def medications(self, medications_text):
+        """Distinct medications in the list as Medication records, canonicalized when a normalizer is configured."""
+        if self.normalizer is None:
+            return [Medication(entry, None, None, entry) for entry in split_medications(medications_text)]
+        return self.normalizer.normalize(medications_text)
+
+    def medication_names(self, medications_text):
+        """Distinct medication names in the list, without doses."""
+        return list(dict.fromkeys(record.name for record in self.medications(medications_text)))
+
+    def medications_key(self, medications_text):
+        """Order- and spelling-independent key for a medication list, doses included."""
+        return "|".join(sorted(canonical_name(record.label) for record in self.medications(medications_text)))
+
+    def pair_key(self, primary, other):
+        return content_key("interaction", self.version, canonical_name(primary), canonical_name(other))
+
+    def analyze_pairs(self, primary, medications, deadline=None):
+        """Return {medication label: text or exception} for Medication records, calling the agent only for uncached pairs.
+
+        The interaction table is consulted by name; the agent is asked about, and its
+        answers cached under, the label, since the dose can change the answer.
+        """
+        results = {}
+        pending = []
+        for record in medications:
+            medication = record.label
+            known = self.matrix.describe(primary, record.name) if self.matrix is not None else None
+            if known is not None:
+                results[medication] = known
+                continue
+            cached = self.cache.get(self.pair_key(primary, medication)) if self.cache is not None else None
+            if cached is not None:
+                results[medication] = cached
+            else:
+                pending.append(medication)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as pool:
+                futures = {medication: usage.submit(pool, self.run_pair, primary, medication, deadline) for medication in pending}
+            for medication, future in futures.items():
+                try:
+                    text = future.result().strip()
+                except Exception as e:
+                    results[medication] = e
+                    continue
+                results[medication] = text
+                if self.cache is not None and text:
+                    self.cache.set(self.pair_key(primary, medication), text)
+        return results
+
+    def analyze(self, primary, medications_text, deadline=None):
+        """Run the pairwise check and merge the results into a single report.
+
+        Identical concurrent checks (same drug, same normalized list) share one run,
+        and with it the first caller's deadline (a hedging.Deadline passed to run_pair).
+        """
+        records = self.medications(medications_text)
+        if not records:
+            return None
+        flight_key = content_key(self.version, canonical_name(primary), self.medications_key(medications_text))
+        shared_results, _ = self.flights.do(flight_key, lambda: self.analyze_pairs(primary, records, deadline))
+        # A coalesced run may have spelled the medications differently
+        by_name = {canonical_name(name): result for name, result in shared_results.items()}
+        medications = [record.label for record in records]
+        results = {medication: by_name.get(canonical_name(medication)) for medication in medications}
+        errors = [result for result in results.values() if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return merge_pair_reports(primary, medications, results)
+
+
+def merge_pair_reports(primary, medications, results):
+    """Combine per-pair results into one markdown report, in medication order."""
+    parts = []
+    for medication in medications:
+        result = results.get(medication)
+        parts.append(f"#### {primary} + {medication}")
+        if isinstance(result, Exception):
+            parts.append(f"Interaction analysis unavailable for this pair: {result}")
+        else:
+            parts.append(result or "No interaction information returned.")
+    return "\n\n".join(parts)
@@ -0,0 +1,128 @@
+"""Background jobs that outlive Streamlit reruns.
+
+A session keeps only the job id; the page polls the job for progress and picks
+up the result once it has finished.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+# Finished jobs nobody collected are dropped after this many seconds
+JOB_RETENTION_SECONDS = 3600
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """Status, latest progress and outcome of one background call."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.progress = None
+        # Position in the API call queue and estimated wait, while waiting for a slot
+        self.queue_position = 0
+        self.estimated_wait = 0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._future = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def set_progress(self, progress):
+        if not self.cancelled:
+            self.progress = progress
+
+    def set_queue(self, position, estimated_wait):
+        self.queue_position, self.estimated_wait = position, estimated_wait
+
+
+class JobManager:
+    """Runs job functions on a thread pool and keeps their Job records for polling."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mediscan-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Schedule fn(job, *args) and return the new job's id."""
+        job = Job()
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        job.status = RUNNING
+        # cancel() sets the flag before the status, so one of the two writes wins consistently
+        if job.cancelled:
+            job.status = CANCELLED
+            return
+        try:
+            result = fn(job, *args)
+        except Exception as e:
+            if not job.cancelled:
+                logger.warning("Job %s failed: %s", job.id, e)
+                job.error = e
+                job.status = FAILED
+        else:
+            if not job.cancelled:
+                job.result = result
+                job.status = DONE
+        job.finished = time.time()
+
+    def get(self, job_id):
+        """The Job for an id, or None if it is unknown or was pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job. Returns False if there is no such unfinished job.
+
+        A job that has not started never runs. A running job is detached rather
+        than interrupted: its result is discarded, although any work it completes
+        still lands in the shared result caches.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancelled.set()
+        job._future.cancel()
+        job.status = CANCELLED
+        job.finished = time.time()
+        return True
+
+    def discard(self, job_id):
+        """Forget a job whose result has been handed off."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
@@ -0,0 +1,171 @@
+"""Normalize free-text medication lists into canonical (ingredient, strength, frequency) records."""
+import re
+from collections import namedtuple
+
+from drug_index import split_ingredients
+
+
+class Medication(namedtuple("Medication", "name strength frequency raw")):
+    """One parsed medication-list entry: canonical name, strength, frequency and the text as entered."""
+
+    __slots__ = ()
+
+    @property
+    def label(self):
+        """The canonical name with the dose as entered, e.g. "metformin 500 mg twice daily"."""
+        return " ".join(part for part in (self.name, self.strength, self.frequency) if part)
+
+
+_ENTRY_SEPARATORS = re.compile(r"[,;\n]+")
+# "500/65mg" gives each ingredient of a combination its own strength in a shared unit
+_STRENGTH = re.compile(
+    r"\b(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)*)\s*(mg|mcg|µg|g|ml|iu|units?|%)(?![a-z])", re.IGNORECASE
+)
+_STRENGTH_SEPARATOR = re.compile(r"\s*/\s*")
+# Split before the filler is stripped, so "Paracetamol/Caffeine" stays two ingredients
+_INGREDIENT_SEPARATORS = re.compile(r"[/+]")
+# Longest phrases first so "twice daily" wins over "daily"
+_FREQUENCIES = (
+    (r"once\s+(?:a\s+)?daily|once\s+a\s+day|\bod\b|\bqd\b", "once daily"),
+    (r"twice\s+(?:a\s+)?daily|twice\s+a\s+day|\bbd\b|\bbid\b", "twice daily"),
+    (r"three\s+times\s+(?:a\s+)?(?:daily|day)|thrice\s+daily|\btds\b|\btid\b", "three times daily"),
+    (r"four\s+times\s+(?:a\s+)?(?:daily|day)|\bqds\b|\bqid\b", "four times daily"),
+    (r"every\s+(\d+)\s*(?:hours?|hrs?|h)\b|\bq(\d+)h\b", "every {} hours"),
+    (r"at\s+night|at\s+bedtime|\bhs\b", "at night"),
+    (r"as\s+needed|when\s+required|\bprn\b|\bsos\b", "as needed"),
+    (r"\bweekly\b|once\s+a\s+week", "weekly"),
+    (r"\bdaily\b|every\s+day", "once daily"),
+)
+_FREQUENCY_PATTERNS = [(re.compile(pattern, re.IGNORECASE), label) for pattern, label in _FREQUENCIES]
+_FILLER = re.compile(r"\b(?:tablets?|tabs?|capsules?|caps?|syrup|oral|take|taking|of|per|dose)\b|[^\w\s+-]", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """Levenshtein distance between a and b, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        # Every later row is at least the minimum of this one
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """Character-trigram inverted index resolving misspelled aliases to canonical names."""
+
+    def __init__(self, max_candidates=10):
+        self.max_candidates = max_candidates
+        self._aliases = []
+        self._canonical = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._aliases)
+
+    def add(self, alias, canonical):
+        alias = alias.casefold().strip()
+        if not alias or alias in self._canonical:
+            return
+        self._canonical[alias] = canonical
+        alias_id = len(self._aliases)
+        self._aliases.append(alias)
+        for trigram in _trigrams(alias):
+            self._postings.setdefault(trigram, []).append(alias_id)
+
+    def resolve(self, term):
+        """Canonical name for term, allowing roughly one edit per four characters, or None."""
+        term = term.casefold().strip()
+        if term in self._canonical:
+            return self._canonical[term]
+        if len(term) < 4:
+            return None
+
+        counts = {}
+        for trigram in _trigrams(term):
+            for alias_id in self._postings.get(trigram, ()):
+                counts[alias_id] = counts.get(alias_id, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:self.max_candidates]
+
+        max_distance = max(1, len(term) // 4)
+        best, best_distance = None, max_distance + 1
+        for alias_id in candidates:
+            alias = self._aliases[alias_id]
+            distance = bounded_edit_distance(term, alias, min(max_distance, best_distance))
+            if distance < best_distance:
+                best, best_distance = alias, distance
+        return self._canonical[best] if best is not None else None
+
+
+class MedicationNormalizer:
+    """Tokenizes medication lists and resolves names and brands to canonical ingredients."""
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else TrigramIndex()
+
+    @classmethod
+    def from_sources(cls, drug_index=None, interaction_matrix=None):
+        """Build the vocabulary from the offline drug index and interaction table, when present."""
+        normalizer = cls()
+        if interaction_matrix is not None:
+            for ingredient in interaction_matrix.ingredient_names():
+                normalizer.index.add(ingredient, ingredient)
+        if drug_index is not None:
+            for composition, brand_names in drug_index.names():
+                canonical = "+".join(split_ingredients(composition))
+                for ingredient in split_ingredients(composition):
+                    normalizer.index.add(ingredient, ingredient)
+                for brand in (brand_names or "").split(","):
+                    normalizer.index.add(brand, canonical)
+        return normalizer
+
+    def parse_entry(self, entry):
+        """Parse one list entry such as "Metformin 500mg twice daily"; None if it names nothing."""
+        raw = _WHITESPACE.sub(" ", entry).strip(" .")
+        rest = raw
+        frequency = None
+        for pattern, label in _FREQUENCY_PATTERNS:
+            match = pattern.search(rest)
+            if match:
+                hours = next((group for group in match.groups() if group), None)
+                frequency = label.format(hours) if hours else label
+                rest = rest[:match.start()] + " " + rest[match.end():]
+                break
+        strengths = [
+            f"{number} {unit.lower()}"
+            for numbers, unit in _STRENGTH.findall(rest) for number in _STRENGTH_SEPARATOR.split(numbers)
+        ]
+        rest = _STRENGTH.sub(" ", rest)
+        names = []
+        for part in _INGREDIENT_SEPARATORS.split(rest):
+            part = _WHITESPACE.sub(" ", _FILLER.sub(" ", part)).strip(" -").casefold()
+            # Skips stray numbers such as the "2" of "1/2 tablet"
+            if any(char.isalpha() for char in part):
+                names.append(self.index.resolve(part) or part)
+        if not names:
+            return None
+        if len(names) == len(strengths) > 1:
+            # Keep each strength next to its ingredient once the names are sorted
+            names, strengths = zip(*sorted(zip(names, strengths)))
+        name = "+".join(sorted(set(names))) if len(names) > 1 else names[0]
+        return Medication(name, " + ".join(strengths) or None, frequency, raw)
+
+    def normalize(self, medications_text):
+        """Parse a free-text list into Medication records, one per distinct name and dose."""
+        records = {}
+        for entry in _ENTRY_SEPARATORS.split(medications_text or ""):
+            record = self.parse_entry(entry)
+            if record is not None and record.label not in records:
+                records[record.label] = record
+        return list(records.values())
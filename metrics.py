@@ -0,0 +1,194 @@
+"""In-process latency spans, counters and their Prometheus/JSON export.
+
+Instrument a stage with a span, then read the numbers back from snapshot():
+
+    with metrics.span("pdf"):
+        build_pdf()
+
+Each observation is a clock read, a lock and a bucket increment, cheap enough to
+leave on everywhere. Set MEDISCAN_METRICS_PATH to have the app rewrite a
+.json or .prom (Prometheus text) file with the current numbers every
+MEDISCAN_METRICS_INTERVAL seconds.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = os.environ.get("MEDISCAN_METRICS_PATH")
+METRICS_INTERVAL = float(os.environ.get("MEDISCAN_METRICS_INTERVAL", 60))
+# Upper bounds in seconds, as for a Prometheus histogram
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Cumulative bucket counts plus a rolling window of recent samples for percentiles."""
+
+    def __init__(self, window=1024):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self._recent.append(seconds)
+
+    def snapshot(self):
+        """Count, sum and recent p50/p95/p99 (None while there are no samples)."""
+        with self._lock:
+            recent = sorted(self._recent)
+            snapshot = {"count": self.count, "sum": self.total, "buckets": list(self.bucket_counts)}
+        for percent in PERCENTILES:
+            rank = max(0, round(percent / 100 * len(recent)) - 1)
+            snapshot[f"p{percent}"] = recent[rank] if recent else None
+        return snapshot
+
+
+class Registry:
+    """Named stage histograms, event counters and pull-based stats sources."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the with block as one observation of stage, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def timed(self, stage):
+        """Decorator form of span()."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def increment(self, event, amount=1):
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + amount
+
+    def register_source(self, name, stats):
+        """Include stats() (a dict of numbers, e.g. cache hit rates) in every snapshot."""
+        with self._lock:
+            self._sources[name] = stats
+
+    def reset(self):
+        """Drop all observations and counters; registered sources stay."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+            sources = dict(self._sources)
+        collected = {}
+        for name, stats in sources.items():
+            try:
+                collected[name] = stats()
+            except Exception as e:
+                logger.warning("Metrics source %s failed: %s", name, e)
+        return {
+            "stages": {stage: histogram.snapshot() for stage, histogram in sorted(histograms.items())},
+            "counters": counters,
+            "sources": collected,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Render the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = ["# TYPE mediscan_stage_seconds histogram"]
+        for stage, stats in snapshot["stages"].items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), stats["buckets"]):
+                cumulative += count
+                lines.append(f'mediscan_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'mediscan_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]}')
+            lines.append(f'mediscan_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append("# TYPE mediscan_events_total counter")
+        for event, count in sorted(snapshot["counters"].items()):
+            lines.append(f'mediscan_events_total{{event="{event}"}} {count}')
+        lines.append("# TYPE mediscan_source gauge")
+        for name, stats in sorted(snapshot["sources"].items()):
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f'mediscan_source{{source="{name}",key="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the snapshot to path, as Prometheus text for .prom files and JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as dump_file:
+            dump_file.write(text)
+        # Scrapers never see a half-written file
+        os.replace(temp_path, path)
+
+
+REGISTRY = Registry()
+span = REGISTRY.span
+observe = REGISTRY.observe
+timed = REGISTRY.timed
+increment = REGISTRY.increment
+register_source = REGISTRY.register_source
+snapshot = REGISTRY.snapshot
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_file_export(path=METRICS_PATH, interval=METRICS_INTERVAL):
+    """Rewrite path with the current metrics every interval seconds from a daemon thread (once per process)."""
+    global _exporter
+    if not path:
+        return
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+
+        def export():
+            while True:
+                time.sleep(interval)
+                try:
+                    REGISTRY.dump(path)
+                except OSError as e:
+                    logger.warning("Could not write metrics to %s: %s", path, e)
+
+        _exporter = threading.Thread(target=export, name="mediscan-metrics", daemon=True)
+        _exporter.start()
@@ -1,22 +1,22 @@
 import streamlit as st
 import os
-import pandas as pd
-from PIL import Image
-from io import BytesIO
-# Using the phi-agent library components
-from phi.agent import Agent
-from phi.model.google import Gemini
-from phi.tools.tavily import TavilyTools
-from tempfile import NamedTemporaryFile
-import base64
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as ReportLabImage
-from reportlab.lib.units import inch
 from datetime import datetime
-import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from phash import dhash
+from image_prep import make_thumbnail
+from result_cache import LRUCache
+from blob_store import BlobStore
+from report import cached_pdf
+from drug_index import split_ingredients
+from interaction_matrix import max_severity
+from interactions import interaction_ingredients
+from jobs import JobManager, DONE, FAILED
+from hedging import Deadline
+import metrics
+import usage
+from usage import SESSION_TOKEN_BUDGET, Usage
+from core import DrugAnalyzer, DrugReport, SECTIONS, SECTIONS_BY_NAME, analysis_cache_key, parse_sections
 
 # Set page configuration
 st.set_page_config(
@@ -27,276 +27,19 @@ st.set_page_config(
 )
 
 # Custom CSS for white theme and enhanced UI
-st.markdown("""
-<style>
-    /* Main theme colors */
-    .stApp {
-        background-color: #ffffff;
-        color: #000000;
-    }
-    
-    /* Header styling */
-    .main-header {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 20px;
-        border-radius: 15px;
-        margin-bottom: 30px;
-        text-align: center;
-        color: white;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 2.5rem;
-        font-weight: 700;
-    }
-    
-    .main-header p {
-        margin: 10px 0 0 0;
-        font-size: 1.2rem;
-        opacity: 0.9;
-    }
-    
-    /* Card styling */
-    .info-card {
-        background: #ffffff;
-        border: 2px solid #e8e8e8;
-        border-radius: 12px;
-        padding: 20px;
-        margin: 15px 0;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-        transition: all 0.3s ease;
-    }
-    
-    .info-card:hover {
-        border-color: #667eea;
-        box-shadow: 0 4px 20px rgba(102,126,234,0.1);
-    }
-    
-    .section-header {
-        color: #2c3e50;
-        font-size: 1.4rem;
-        font-weight: 600;
-        margin-bottom: 15px;
-        padding-bottom: 10px;
-        border-bottom: 3px solid #667eea;
-    }
-    
-    /* Upload section */
-    .upload-section {
-        background: #f8f9ff;
-        border: 2px dashed #667eea;
-        border-radius: 12px;
-        padding: 30px;
-        text-align: center;
-        margin: 20px 0;
-    }
-    
-    /* Result cards */
-    .result-card {
-        background: #ffffff;
-        border-left: 4px solid #667eea;
-        border-radius: 8px;
-        padding: 20px;
-        margin: 15px 0;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-    }
-    
-    .result-header {
-        color: #2c3e50;
-        font-size: 1.3rem;
-        font-weight: 600;
-        margin-bottom: 12px;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    
-    .result-content {
-        color: #34495e;
-        line-height: 1.6;
-        font-size: 1rem;
-    }
-    
-    /* Safety indicators */
-    .safety-safe {
-        background: #d4edda;
-        border: 1px solid #c3e6cb;
-        border-radius: 6px;
-        padding: 12px;
-        margin: 8px 0;
-        color: #155724;
-    }
-    
-    .safety-warning {
-        background: #fff3cd;
-        border: 1px solid #ffeaa7;
-        border-radius: 6px;
-        padding: 12px;
-        margin: 8px 0;
-        color: #856404;
-    }
-    
-    .safety-danger {
-        background: #f8d7da;
-        border: 1px solid #f1c2c7;
-        border-radius: 6px;
-        padding: 12px;
-        margin: 8px 0;
-        color: #721c24;
-    }
-    
-    /* Tablet names styling */
-    .tablet-name {
-        background: #e8f4f8;
-        border: 1px solid #b8daff;
-        border-radius: 20px;
-        padding: 8px 16px;
-        margin: 5px;
-        display: inline-block;
-        color: #004085;
-        font-weight: 500;
-    }
-    
-    /* Interaction analysis */
-    .interaction-severe {
-        background: #ffebee;
-        border: 2px solid #f44336;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #c62828;
-    }
-    
-    .interaction-moderate {
-        background: #fff8e1;
-        border: 2px solid #ff9800;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #ef6c00;
-    }
-    
-    .interaction-minor {
-        background: #f3e5f5;
-        border: 2px solid #9c27b0;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #7b1fa2;
-    }
-    
-    .interaction-low {
-        background: #e8f5e8;
-        border: 2px solid #4caf50;
-        border-radius: 8px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #2e7d32;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 15px 30px;
-        font-size: 1.1rem;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(102,126,234,0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(102,126,234,0.4);
-    }
-    
-    /* Disclaimer box */
-    .disclaimer {
-        background: #fff3cd;
-        border: 1px solid #ffeaa7;
-        border-radius: 10px;
-        padding: 20px;
-        margin: 20px 0;
-        border-left: 5px solid #ffc107;
-    }
-    
-    .disclaimer strong {
-        color: #856404;
-        font-size: 1.1rem;
-    }
-    
-    /* Progress and loading */
-    .stProgress > div > div {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    }
-    
-    /* Text input styling */
-    .stTextArea textarea {
-        border: 2px solid #e8e8e8;
-        border-radius: 8px;
-        padding: 12px;
-        font-size: 1rem;
-        transition: border-color 0.3s ease;
-    }
-    
-    .stTextArea textarea:focus {
-        border-color: #667eea;
-        box-shadow: 0 0 0 3px rgba(102,126,234,0.1);
-    }
-    
-    /* File uploader */
-    .stFileUploader {
-        border: 2px dashed #667eea;
-        border-radius: 12px;
-        padding: 20px;
-        background: #f8f9ff;
-    }
-    
-    /* Metrics styling */
-    .metric-card {
-        background: white;
-        border: 1px solid #e8e8e8;
-        border-radius: 8px;
-        padding: 15px;
-        text-align: center;
-        margin: 10px 0;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-    }
-    
-    .metric-value {
-        font-size: 1.5rem;
-        font-weight: 700;
-        color: #667eea;
-        margin-bottom: 5px;
-    }
-    
-    .metric-label {
-        font-size: 0.9rem;
-        color: #666;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    /* Responsive adjustments */
-    @media (max-width: 768px) {
-        .main-header h1 {
-            font-size: 2rem;
-        }
-        
-        .main-header p {
-            font-size: 1rem;
-        }
-        
-        .info-card {
-            padding: 15px;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "mediscan.css")
+
+@st.cache_resource
+def load_stylesheet():
+    """Import the stylesheet from app/static when static serving is on, so each rerun sends one line
+    and the browser caches the CSS; otherwise inline it (read once per process)."""
+    if st.get_option("server.enableStaticServing"):
+        return '<style>@import url("app/static/mediscan.css");</style>'
+    with open(STYLESHEET_PATH, encoding="utf-8") as stylesheet:
+        return f"<style>{stylesheet.read()}</style>"
+
+# A style-only element goes to the event container and takes no space in the layout
+st.html(load_stylesheet())
 
 # API Keys
 TAVILY_API_KEY = st.secrets.get("TAVILY_API_KEY")
@@ -308,289 +51,80 @@ if not TAVILY_API_KEY or not GOOGLE_API_KEY:
     st.stop()
 
 MAX_IMAGE_WIDTH = 300
-
-SYSTEM_PROMPT = """
-You are an expert in pharmaceutical analysis and AI-driven drug composition recognition with specialized knowledge in drug safety and interactions.
-Your role is to analyze a tablet's composition from an image, identify its ingredients, and provide comprehensive insights about the drug including safety considerations.
-
-Additionally, once a drug composition is identified, retrieve and display its uses, side effects, cost, available tablet names/brands, usage instructions, and critical safety information using reliable medical sources.
-Ensure that you fetch accurate and specific details instead of generic placeholders.
-"""
-
-# START OF CRITICAL CHANGE: REVISED INSTRUCTIONS FOR STRUCTURE AND CONTENT
-INSTRUCTIONS = """
-- Extract the drug composition from the tablet image.
-- Use this composition to fetch and return detailed, medically accurate information from trusted sources.
-- **CRITICAL FORMATTING:** Return ALL information in a strict key-value format using asterisks. Do NOT use bullet points, numbered lists, or fragmented text outside of the section content.
-- **CRITICAL CONTENT:** Provide only medical/scientific uses and avoid manufacturer promotional language.
-
-- Return all information in this exact structured format:
-  *Composition:* <composition>
-  *Uses:* <accurate medical/scientific uses based on online sources>
-  *Available Tablet Names:* <list of brand names and generic names that contain this composition>
-  *How to Use:* <detailed dosage instructions, timing, with or without food>
-  *Side Effects:* <verified side effects>
-  *Cost:* <actual cost from trusted sources>
-  *Safety with Alcohol:* <specific advice about alcohol consumption>
-  *Pregnancy Safety:* <pregnancy category and safety advice>
-  *Breastfeeding Safety:* <safety for nursing mothers>
-  *Driving Safety:* <effects on driving ability>
-  *General Safety Advice:* <additional precautions and contraindications>
-"""
-# END OF CRITICAL CHANGE
-
-DRUG_INTERACTION_PROMPT = """
-You are a pharmaceutical expert specializing in drug interactions and safety analysis.
-Analyze the potential interactions between the identified drug composition and the additional medications provided by the user.
-
-Provide detailed interaction analysis including:
-- Severity level of interactions (None, Minor, Moderate, Major, Severe)
-- Specific interaction mechanisms
-- Clinical significance
-- Recommended actions or precautions
-- Alternative suggestions if dangerous interactions exist
-
-Be thorough and prioritize patient safety in your analysis.
-"""
+THUMBNAIL_CACHE_ENTRIES = 256
+# Stream the analysis into the result cards (set MEDISCAN_STREAM_ANALYSIS=0 to disable)
+STREAM_ANALYSIS = os.environ.get("MEDISCAN_STREAM_ANALYSIS", "1") != "0"
+# Seconds between status checks while an analysis job is running
+JOB_POLL_SECONDS = 1.0
+# Latency, cache and tool call numbers in the sidebar (set MEDISCAN_ADMIN_PANEL=1 to enable)
+ADMIN_PANEL = os.environ.get("MEDISCAN_ADMIN_PANEL") == "1"
 
 @st.cache_resource
-def get_agent():
-    """Initialize and cache the AI agent."""
+def get_analyzer():
+    """Initialize and cache the analysis core shared by all sessions."""
     try:
-        # FIX APPLIED: Changed to the stable, higher-limit model
-        return Agent(
-            model=Gemini(id="gemini-2.5-flash", api_key=GOOGLE_API_KEY),
-            system_prompt=SYSTEM_PROMPT,
-            instructions=INSTRUCTIONS,
-            tools=[TavilyTools(api_key=TAVILY_API_KEY)],
-            markdown=True,
-        )
+        analyzer = DrugAnalyzer(GOOGLE_API_KEY, TAVILY_API_KEY)
+        metrics.start_file_export()
+        return analyzer
     except Exception as e:
         st.error(f"❌ Error initializing agent: {e}")
         return None
 
-@st.cache_resource
-def get_interaction_agent():
-    """Initialize and cache the drug interaction agent."""
-    try:
-        # FIX APPLIED: Changed to the stable, higher-limit model
-        return Agent(
-            model=Gemini(id="gemini-2.5-flash", api_key=GOOGLE_API_KEY),
-            system_prompt=DRUG_INTERACTION_PROMPT,
-            tools=[TavilyTools(api_key=TAVILY_API_KEY)],
-            markdown=True,
-        )
-    except Exception as e:
-        st.error(f"❌ Error initializing interaction agent: {e}")
-        return None
+@st.cache_data(max_entries=64, show_spinner=False)
+def image_phash(image_bytes):
+    """Perceptual hash of an upload, memoized across reruns."""
+    return dhash(image_bytes)
 
-def resize_image_for_display(image_file):
-    """Resize image for display only, returns bytes."""
-    try:
-        # Reset file pointer to beginning
-        image_file.seek(0)
-        img = Image.open(image_file)
-        # Reset again for later use
-        image_file.seek(0)
-        
-        aspect_ratio = img.height / img.width
-        new_height = int(MAX_IMAGE_WIDTH * aspect_ratio)
-        img = img.resize((MAX_IMAGE_WIDTH, new_height), Image.Resampling.LANCZOS)
-        buf = BytesIO()
-        img.save(buf, format="PNG")
-        return buf.getvalue()
-    except Exception as e:
-        st.error(f"🖼️ Error resizing image: {e}")
-        return None
+def find_similar_analysis(uploaded_file):
+    """Return (distance, analysis) for a previously analyzed look-alike image, or None.
 
-def extract_composition_and_details(image_path):
-    """Extract composition and related drug details from the tablet image using AI."""
-    agent = get_agent()
-    if agent is None:
+    Looked up once per upload, so reruns neither repeat the search nor read the cache.
+    """
+    matches = st.session_state.setdefault("similar_analyses", {})
+    digest = upload_digest(uploaded_file)
+    if digest in matches:
+        return matches[digest]
+    analyzer = get_analyzer()
+    if analyzer is None:
         return None
-
+    image_bytes = uploaded_file.getvalue()
     try:
-        with st.spinner("🔬 Analyzing tablet image and retrieving comprehensive medical information..."):
-            response = agent.run(
-                "Extract the drug composition from this tablet image and provide its uses, side effects, cost, available tablet names/brands, usage instructions, and comprehensive safety information including alcohol interactions, pregnancy safety, breastfeeding considerations, and driving safety.",
-                images=[image_path],
-            )
-            return response.content.strip()
+        # An exact match is answered by the result cache anyway, so only look-alikes are offered
+        similar = analyzer.find_similar(
+            image_phash(image_bytes), exclude_key=analysis_cache_key(image_bytes, analyzer.prompt_version())
+        )
     except Exception as e:
-        st.error(f"🚨 Error extracting composition and details: {e}")
-        return None
-
-def analyze_drug_interactions(drug_composition, additional_medications):
-    """Analyze potential drug interactions."""
-    if not additional_medications.strip():
-        return None
-    
-    interaction_agent = get_interaction_agent()
-    if interaction_agent is None:
+        st.warning(f"Similar image lookup unavailable: {e}")
         return None
+    matches.clear()
+    matches[digest] = similar
+    return similar
 
-    try:
-        with st.spinner("🔍 Analyzing drug interactions..."):
-            query = f"""
-            Analyze potential drug interactions between:
-            Primary Drug: {drug_composition}
-            Additional Medications: {additional_medications}
-            
-            Provide detailed interaction analysis with severity levels and safety recommendations.
-            """
-            response = interaction_agent.run(query)
-            return response.content.strip()
-    except Exception as e:
-        st.error(f"🚨 Error analyzing drug interactions: {e}")
-        return None
+@st.cache_resource
+def get_thumbnail_cache():
+    """Process-wide LRU of display thumbnails keyed by upload content hash."""
+    return LRUCache(max_entries=THUMBNAIL_CACHE_ENTRIES)
 
-def save_uploaded_file(uploaded_file):
-    """Save the uploaded file to disk."""
-    try:
-        # Get file extension from the uploaded file name
-        file_extension = os.path.splitext(uploaded_file.name)[1]
-        
-        with NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            temp_file.write(uploaded_file.getvalue())
-            temp_path = temp_file.name
-        return temp_path
-    except Exception as e:
-        st.error(f"💾 Error saving uploaded file: {e}")
-        return None
+def upload_digest(uploaded_file):
+    """SHA-256 of an upload, computed once per upload instead of on every rerun."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests.clear()
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
 
-def create_pdf(image_data, analysis_results, interaction_analysis=None, additional_meds=None):
-    """Create a PDF report of the analysis."""
+def resize_image_for_display(image_file):
+    """Resize image for display only, returns bytes (memoized per upload content)."""
     try:
-        buffer = BytesIO()
-        pdf = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=72
-        )
-        
-        # Content to add to PDF
-        content = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Title'],
-            fontSize=18,
-            alignment=1,
-            spaceAfter=12,
-            textColor=colors.navy
-        )
-        heading_style = ParagraphStyle(
-            'Heading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.navy,
-            spaceAfter=6
-        )
-        normal_style = ParagraphStyle(
-            'Body',
-            parent=styles['Normal'],
-            fontSize=12,
-            leading=14
-        )
-        disclaimer_style = ParagraphStyle(
-            'Disclaimer',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.red,
-            borderWidth=1,
-            borderColor=colors.red,
-            borderPadding=5,
-            backColor=colors.pink,
-            alignment=1
-        )
-        
-        # Title
-        content.append(Paragraph("💊 MediScan - Comprehensive Drug Analysis Report", title_style))
-        content.append(Spacer(1, 0.25*inch))
-        
-        # Disclaimer
-        content.append(Paragraph(
-            "⚠️ MEDICAL DISCLAIMER: This information is provided for educational purposes only and should not replace professional medical advice. "
-            "Always consult with a healthcare professional before making any medical decisions or changes to your medication regimen.",
-            disclaimer_style
-        ))
-        content.append(Spacer(1, 0.25*inch))
-        
-        # Date and time
-        current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        content.append(Paragraph(f"📅 Generated on: {current_datetime}", normal_style))
-        content.append(Spacer(1, 0.25*inch))
-        
-        # Add image if available
-        if image_data:
-            try:
-                img_temp = BytesIO(image_data)
-                img = Image.open(img_temp)
-                img_width, img_height = img.size
-                aspect = img_height / float(img_width)
-                display_width = 4 * inch
-                display_height = display_width * aspect
-                
-                # Reset BytesIO position for ReportLab
-                img_temp.seek(0)
-                img_obj = ReportLabImage(img_temp, width=display_width, height=display_height)
-                content.append(Paragraph("📸 Analyzed Image:", heading_style))
-                content.append(img_obj)
-                content.append(Spacer(1, 0.25*inch))
-            except Exception as img_error:
-                st.warning(f"Could not add image to PDF: {img_error}")
-        
-        # Analysis results
-        content.append(Paragraph("🔬 Drug Analysis Results:", heading_style))
-        
-        # Format the analysis results for PDF
-        if analysis_results:
-            # Use regex to find sections
-            section_pattern = r"\*([\w\s]+):\*(.*?)(?=\*[\w\s]+:\*|$)"
-            matches = re.findall(section_pattern, analysis_results, re.DOTALL | re.IGNORECASE)
-            
-            if matches:
-                for section_title, section_content in matches:
-                    content.append(Paragraph(f"<b>{section_title.strip()}:</b>", normal_style))
-                    
-                    # Handle multiline content
-                    paragraphs = section_content.strip().split("\n")
-                    for para in paragraphs:
-                        if para.strip():
-                            # Escape HTML characters for ReportLab
-                            clean_para = para.strip().replace('<', '&lt;').replace('>', '&gt;')
-                            content.append(Paragraph(clean_para, normal_style))
-                    
-                    content.append(Spacer(1, 0.15*inch))
-        
-        # Drug interaction analysis
-        if interaction_analysis and additional_meds:
-            content.append(Paragraph("💊 Drug Interaction Analysis:", heading_style))
-            content.append(Paragraph(f"<b>Additional Medications:</b> {additional_meds}", normal_style))
-            content.append(Spacer(1, 0.1*inch))
-            
-            clean_interaction = interaction_analysis.replace('<', '&lt;').replace('>', '&gt;')
-            content.append(Paragraph(clean_interaction, normal_style))
-            content.append(Spacer(1, 0.25*inch))
-        
-        # Footer
-        content.append(Spacer(1, 0.5*inch))
-        content.append(Paragraph("© 2025 MediScan - Comprehensive Drug Analyzer | Powered by Gemini AI + Tavily", 
-                                 ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.gray)))
-        
-        # Build PDF
-        pdf.build(content)
-        
-        # Get the PDF value from the buffer
-        buffer.seek(0)
-        return buffer.getvalue()
+        thumbnail_cache = get_thumbnail_cache()
+        cache_key = upload_digest(image_file)
+        thumbnail = thumbnail_cache.get(cache_key)
+        if thumbnail is None:
+            thumbnail = make_thumbnail(image_file.getvalue(), MAX_IMAGE_WIDTH)
+            thumbnail_cache.set(cache_key, thumbnail)
+        return thumbnail
     except Exception as e:
-        st.error(f"📄 Error creating PDF: {e}")
+        st.error(f"🖼️ Error resizing image: {e}")
         return None
 
 def display_tablet_names(tablet_names_text):
@@ -636,11 +170,100 @@ def display_safety_info(content, safety_type):
     else:
         st.markdown(f'<div class="safety-safe">ℹ️ <strong>{safety_type}:</strong> {content}</div>', unsafe_allow_html=True)
 
-def display_interaction_analysis(interaction_text):
-    """Display interaction analysis with appropriate styling."""
+def display_section(section_name, icon, section_type, content):
+    """Display a single analysis section as a result card."""
+    # Create result card for each section
+    st.markdown(f'<div class="result-card">', unsafe_allow_html=True)
+    st.markdown(f'<div class="result-header">{icon} {section_name}</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="result-content">', unsafe_allow_html=True)
+    
+    # Special handling for different section types
+    if section_type == "tablet_names":
+        display_tablet_names(content)
+    elif section_type == "safety":
+        display_safety_info(content, section_name)
+    elif section_type == "composition":
+        st.markdown(f"**{content}**")
+    elif section_type == "uses":
+        # Format uses as bullet points if multiple
+        if '\n' in content or ',' in content or '•' in content: # Added '•' check for robustness
+            uses_list = content.replace('\n', ', ').split(',')
+            for use in uses_list:
+                if use.strip():
+                    st.markdown(f"• {use.strip()}")
+        else:
+            st.markdown(content)
+    elif section_type == "side_effects":
+        # Format side effects with warning styling
+        if '\n' in content or ',' in content or '•' in content: # Added '•' check for robustness
+            effects_list = content.replace('\n', ', ').split(',')
+            for effect in effects_list:
+                if effect.strip():
+                    st.markdown(f"⚠️ {effect.strip()}")
+        else:
+            st.markdown(f"⚠️ {content}")
+    elif section_type == "cost":
+        # Highlight cost information
+        st.markdown(f"💰 **{content}**")
+    else:
+        st.markdown(content)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+SEVERITY_GRID_COLORS = {
+    "Severe": "#ffebee",
+    "Major": "#ffebee",
+    "Moderate": "#fff8e1",
+    "Minor": "#f3e5f5",
+    "None": "#e8f5e8",
+}
+
+def interaction_severity_grid(drug_composition, additional_medications):
+    """Return (ingredients, grid, fully_known) from the local interaction table, or None without one."""
+    analyzer = get_analyzer()
+    if analyzer is None or analyzer.interaction_matrix is None:
+        return None
+    primary_count = len(split_ingredients(drug_composition))
+    medications = analyzer.interaction_engine.medication_names(additional_medications)
+    ingredients = interaction_ingredients(drug_composition, medications)
+    grid = analyzer.interaction_matrix.grid(ingredients)
+    # Every (primary ingredient, medication ingredient) pair must be in the table
+    fully_known = all(
+        grid[i][j] is not None
+        for i in range(primary_count)
+        for j in range(primary_count, len(ingredients))
+    )
+    return ingredients, grid, fully_known
+
+def display_severity_grid(ingredients, grid):
+    """Display the pairwise severity grid from the local interaction table."""
+    header = "".join(f"<th>{name.title()}</th>" for name in ingredients)
+    rows = ""
+    for name, row in zip(ingredients, grid):
+        cells = ""
+        for other, severity in zip(ingredients, row):
+            if other == name:
+                cells += "<td>—</td>"
+            elif severity is None:
+                cells += '<td title="Not in the local interaction table">?</td>'
+            else:
+                cells += f'<td style="background: {SEVERITY_GRID_COLORS[severity]};">{severity}</td>'
+        rows += f"<tr><th>{name.title()}</th>{cells}</tr>"
+    st.markdown(f'<table class="severity-grid"><tr><th></th>{header}</tr>{rows}</table>', unsafe_allow_html=True)
+
+def display_interaction_analysis(interaction_text, known_severity=None):
+    """Display interaction analysis with appropriate styling.
+
+    known_severity comes from the local interaction table and, when given,
+    replaces keyword scanning of the analysis text.
+    """
     if not interaction_text:
         return
     
+    if known_severity is not None:
+        interaction_text = known_severity
+    
     # Determine interaction severity
     if "severe" in interaction_text.lower() or "major" in interaction_text.lower():
         st.markdown(f'<div class="interaction-severe">🚨 <strong>SEVERE/MAJOR INTERACTION DETECTED</strong></div>', unsafe_allow_html=True)
@@ -651,20 +274,222 @@ def display_interaction_analysis(interaction_text):
     else:
         st.markdown(f'<div class="interaction-low">✅ <strong>LOW INTERACTION RISK</strong></div>', unsafe_allow_html=True)
 
+@st.cache_resource
+def get_background_executor():
+    """Shared thread pool for interaction checks started while an analysis is still streaming."""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def get_blob_store():
+    """Process-wide image store; sessions keep only a BlobRef (content hash) to their image."""
+    store = BlobStore()
+    metrics.register_source("blobs", store.stats)
+    return store
+
+@st.cache_resource
+def get_job_manager():
+    """Process-wide analysis jobs; sessions only keep a job id."""
+    manager = JobManager()
+    metrics.register_source("jobs", manager.stats)
+    return manager
+
+def run_analysis(job, analyzer, image, additional_meds, executor, extracted_info=None):
+    """Job body: analyze the image (a BlobRef) unless an analysis is given, and check interactions.
+
+    Interaction checks start on executor as soon as the composition is final.
+    Returns (extracted_info, image, interaction_analysis, interaction_error, analysis_usage).
+    """
+    with usage.track() as analysis_usage:
+        # Blobs only on disk come back memory-mapped; the model needs real bytes
+        image_bytes = bytes(image.read())
+        extracted_info, interaction_analysis, interaction_error = _run_analysis(
+            job, analyzer, image_bytes, additional_meds, executor, extracted_info
+        )
+    return extracted_info, image, interaction_analysis, interaction_error, analysis_usage
+
+def _run_analysis(job, analyzer, image_bytes, additional_meds, executor, extracted_info):
+    # One time budget for the analysis and the interaction check together
+    deadline = Deadline.for_request()
+    interaction_future = None
+
+    def on_composition(composition):
+        nonlocal interaction_future
+        if interaction_future is None and additional_meds.strip():
+            interaction_future = usage.submit(
+                executor, analyzer.analyze_drug_interactions, composition, additional_meds, deadline
+            )
+
+    if extracted_info is None:
+        extracted_info = analyzer.extract_composition_and_details(
+            image_bytes, on_progress=job.set_progress if STREAM_ANALYSIS else None, on_queue=job.set_queue,
+            deadline=deadline, on_composition=on_composition
+        )
+    if not extracted_info:
+        raise ValueError("No analysis was returned. Please try with a clearer image.")
+
+    interaction_analysis = interaction_error = None
+    if additional_meds.strip():
+        try:
+            if interaction_future is not None:
+                interaction_analysis = interaction_future.result()
+            else:
+                interaction_analysis = analyzer.analyze_drug_interactions(
+                    DrugReport.parse(extracted_info).composition or "Unknown composition", additional_meds, deadline
+                )
+        except Exception as e:
+            interaction_error = str(e)
+    return extracted_info, interaction_analysis, interaction_error
+
+def start_analysis(image_bytes, additional_meds, extracted_info=None):
+    """Submit an analysis job for this session; the page picks up the result when it finishes."""
+    analyzer = get_analyzer()
+    if analyzer is None:
+        return
+    if SESSION_TOKEN_BUDGET and st.session_state.session_usage.total_tokens >= SESSION_TOKEN_BUDGET:
+        st.session_state.analysis_error = f"🚨 This session has used its budget of {SESSION_TOKEN_BUDGET:,} tokens."
+        return
+    st.session_state.analysis_error = None
+    st.session_state.analysis_job = get_job_manager().submit(
+        run_analysis, analyzer, get_blob_store().put(image_bytes), additional_meds, get_background_executor(),
+        extracted_info
+    )
+
+class StreamingResultsView:
+    """Fills result cards in from the partial text of an analysis that is still streaming."""
+
+    def __init__(self, container):
+        self.container = container
+        self.placeholders = []
+        self.completed = 0
+
+    def update(self, text):
+        sections = parse_sections(text)
+        for _ in range(len(self.placeholders), len(sections)):
+            self.placeholders.append(self.container.empty())
+        
+        # Every section followed by another header is final and gets its full card
+        for index in range(self.completed, len(sections) - 1):
+            section_name, content = sections[index]
+            with self.placeholders[index].container():
+                display_section(*SECTIONS_BY_NAME[section_name.lower()], content)
+        self.completed = max(self.completed, len(sections) - 1)
+        
+        if sections:
+            section_name, content = sections[-1]
+            _, icon, _ = SECTIONS_BY_NAME[section_name.lower()]
+            self.placeholders[-1].markdown(f"**{icon} {section_name}** ⏳\n\n{content}")
+
+def complete_analysis(extracted_info, image, interaction_analysis=None, interaction_error=None,
+                      analysis_usage=None):
+    """Store a finished analysis in session state and refresh the page."""
+    # Parse once; display, PDF and interaction checks all read the same DrugReport
+    st.session_state.drug_report = DrugReport.parse(extracted_info)
+    # Only the BlobRef; replacing it or dropping the session releases the image
+    st.session_state.original_image = image
+    st.session_state.interaction_analysis = interaction_analysis
+    st.session_state.analysis_usage = analysis_usage
+    if analysis_usage is not None:
+        st.session_state.session_usage.add(analysis_usage)
+    if interaction_error:
+        st.session_state.analysis_error = f"🚨 Error analyzing drug interactions: {interaction_error}"
+    st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_analysis_job():
+    """Poll this session's analysis job, showing progress and handing off the result when done."""
+    manager = get_job_manager()
+    job_id = st.session_state.analysis_job
+    job = manager.get(job_id)
+    if job is None:
+        # The server restarted or the job expired
+        st.session_state.analysis_job = None
+        st.rerun()
+
+    if job.done:
+        st.session_state.analysis_job = None
+        manager.discard(job_id)
+        if job.status == DONE:
+            complete_analysis(*job.result)
+        elif job.status == FAILED:
+            st.session_state.analysis_error = f"🚨 Analysis failed: {job.error}"
+        st.rerun()
+
+    if job.queue_position:
+        st.info(f"⏳ High demand right now. You are #{job.queue_position} in the queue (about {job.estimated_wait}s to go).")
+    elif job.progress:
+        StreamingResultsView(st.container()).update(job.progress)
+    else:
+        st.info("🔬 Analyzing tablet image and retrieving comprehensive medical information...")
+
+    if st.button("✖️ Cancel Analysis", use_container_width=True):
+        manager.cancel(job_id)
+        st.session_state.analysis_job = None
+        st.rerun()
+
+def display_admin_panel():
+    """Sidebar panel with per-stage latency percentiles, cache hit rates and tool call counts."""
+    # Both register their stats sources on first use
+    get_analyzer()
+    get_job_manager()
+    snapshot = metrics.snapshot()
+    with st.sidebar:
+        st.markdown("### 📈 Performance")
+        stage_rows = [
+            {
+                "Stage": stage,
+                "Calls": stats["count"],
+                **{f"p{percent} (s)": round(stats[f"p{percent}"], 3) for percent in metrics.PERCENTILES},
+            }
+            for stage, stats in snapshot["stages"].items()
+        ]
+        if stage_rows:
+            st.dataframe(stage_rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No stages timed yet.")
+        
+        sources = snapshot["sources"]
+        for name, stats in sources.items():
+            if "hit_rate" in stats:
+                st.metric(f"{name.replace('_', ' ').title()} hit rate", f"{stats['hit_rate']:.0%}",
+                          help=f"{stats['hits']} hits, {stats['misses']} misses")
+        if "search" in sources:
+            st.metric("Tavily searches", sources["search"]["searches"],
+                      help=f"{sources['search']['upstream_searches']} reached the Tavily API")
+        for event, count in sorted(snapshot["counters"].items()):
+            st.metric(event.replace("_", " ").capitalize(), count)
+        if "usage_today" in sources:
+            st.metric("Tokens today", f"{sources['usage_today']['total_tokens']:,}")
+        st.metric("Tokens this session", f"{st.session_state.session_usage.total_tokens:,}",
+                  help=st.session_state.session_usage.summary())
+        
+        st.download_button("Metrics (JSON)", data=metrics.REGISTRY.to_json, file_name="mediscan_metrics.json",
+                           mime="application/json")
+        st.download_button("Metrics (Prometheus)", data=metrics.REGISTRY.to_prometheus, file_name="mediscan_metrics.prom",
+                           mime="text/plain")
+
 def main():
     # Initialize session state for button tracking
     if 'analyze_clicked' not in st.session_state:
         st.session_state.analyze_clicked = False
-    if 'analysis_results' not in st.session_state:
-        st.session_state.analysis_results = None
+    if 'drug_report' not in st.session_state:
+        st.session_state.drug_report = None
     if 'original_image' not in st.session_state:
         st.session_state.original_image = None
-    if 'drug_composition' not in st.session_state:
-        st.session_state.drug_composition = None
     if 'interaction_analysis' not in st.session_state:
         st.session_state.interaction_analysis = None
     if 'additional_medications' not in st.session_state:
         st.session_state.additional_medications = ""
+    if 'analysis_job' not in st.session_state:
+        st.session_state.analysis_job = None
+    if 'analysis_error' not in st.session_state:
+        st.session_state.analysis_error = None
+    if 'analysis_usage' not in st.session_state:
+        st.session_state.analysis_usage = None
+    if 'session_usage' not in st.session_state:
+        st.session_state.session_usage = Usage()
+    
+    if ADMIN_PANEL:
+        display_admin_panel()
 
     # Header
     st.markdown("""
@@ -685,6 +510,13 @@ def main():
     # Main content in two columns
     col1, col2 = st.columns([1, 1], gap="large")
     
+    with col2:
+        st.markdown('<div class="section-header">📊 Analysis Results</div>', unsafe_allow_html=True)
+        if st.session_state.analysis_error:
+            st.error(st.session_state.analysis_error)
+        # Result cards stream in here while an analysis is running
+        live_results = st.container()
+    
     with col1:
         st.markdown('<div class="info-card">', unsafe_allow_html=True)
         st.markdown('<div class="section-header">📤 Upload Tablet Image</div>', unsafe_allow_html=True)
@@ -721,115 +553,37 @@ def main():
         
         # Analyze button
         if uploaded_file:
+            # Offer to reuse the analysis of a near-identical, previously analyzed photo
+            similar = find_similar_analysis(uploaded_file)
+            if similar:
+                distance, previous_analysis = similar
+                st.info(f"♻️ This tablet looks like one analyzed before (difference score: {distance}). You can reuse that analysis instead of running a new one.")
+                if st.button("♻️ Reuse Previous Analysis", use_container_width=True):
+                    st.session_state.analyze_clicked = True
+                    st.session_state.additional_medications = additional_meds
+                    start_analysis(uploaded_file.getvalue(), additional_meds, extracted_info=previous_analysis)
+            
             if st.button("🔬 Analyze Tablet & Check Safety", use_container_width=True):
                 st.session_state.analyze_clicked = True
                 st.session_state.additional_medications = additional_meds
                 
-                # Save uploaded file and analyze
-                temp_path = save_uploaded_file(uploaded_file)
-                if temp_path:
-                    try:
-                        extracted_info = extract_composition_and_details(temp_path)
-                        
-                        if extracted_info:
-                            # Store results in session state
-                            st.session_state.analysis_results = extracted_info
-                            st.session_state.original_image = uploaded_file.getvalue()
-                            
-                            # Extract drug composition for interaction analysis
-                            composition_match = re.search(r"\*Composition:\*(.*?)(?=\*[\w\s]+:\*|$)", extracted_info, re.DOTALL | re.IGNORECASE)
-                            if composition_match:
-                                st.session_state.drug_composition = composition_match.group(1).strip()
-                            
-                            # Analyze drug interactions if additional medications provided
-                            if additional_meds.strip():
-                                interaction_result = analyze_drug_interactions(
-                                    st.session_state.drug_composition or "Unknown composition",
-                                    additional_meds
-                                )
-                                st.session_state.interaction_analysis = interaction_result
-                            
-                            st.success("✅ Comprehensive analysis completed successfully!")
-                            st.rerun()
-                        else:
-                            st.error("❌ Analysis failed. Please try with a clearer image.")
-                        
-                    except Exception as e:
-                        st.error(f"🚨 Analysis failed: {e}")
-                    finally:
-                        # Clean up temp file
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
+                # The job runs in the background, so reruns neither block on nor restart it
+                start_analysis(uploaded_file.getvalue(), additional_meds)
+    
+    if st.session_state.analysis_job:
+        with live_results:
+            show_analysis_job()
     
     with col2:
-        st.markdown('<div class="section-header">📊 Analysis Results</div>', unsafe_allow_html=True)
-        
-        # Display results if available
-        if st.session_state.analysis_results:
-            # Parse and display results
-            analysis_text = st.session_state.analysis_results
+        # Display results if available, unless a new analysis is replacing them
+        if st.session_state.drug_report and not st.session_state.analysis_job:
+            # Display the sections parsed when the result arrived
+            drug_report = st.session_state.drug_report
             
-            # Enhanced sections list with proper organization
-            sections = [
-                ("Composition", "🧬", "composition"),
-                ("Uses", "🎯", "uses"), 
-                ("Available Tablet Names", "💊", "tablet_names"),
-                ("How to Use", "📋", "usage"),
-                ("Side Effects", "⚠️", "side_effects"),
-                ("Cost", "💰", "cost"),
-                ("Safety with Alcohol", "🍺", "safety"),
-                ("Pregnancy Safety", "🤱", "safety"),
-                ("Breastfeeding Safety", "🍼", "safety"),
-                ("Driving Safety", "🚗", "safety"),
-                ("General Safety Advice", "🛡️", "safety")
-            ]
-            
-            for section_name, icon, section_type in sections:
-                # Pattern to match sections
-                pattern = rf"\*{re.escape(section_name)}:\*(.*?)(?=\*(?:{'|'.join(re.escape(s[0]) for s in sections)}):\*|$)"
-                match = re.search(pattern, analysis_text, re.DOTALL | re.IGNORECASE)
-                
-                if match:
-                    content = match.group(1).strip()
-                    
-                    # Create result card for each section
-                    st.markdown(f'<div class="result-card">', unsafe_allow_html=True)
-                    st.markdown(f'<div class="result-header">{icon} {section_name}</div>', unsafe_allow_html=True)
-                    st.markdown(f'<div class="result-content">', unsafe_allow_html=True)
-                    
-                    # Special handling for different section types
-                    if section_type == "tablet_names":
-                        display_tablet_names(content)
-                    elif section_type == "safety":
-                        display_safety_info(content, section_name)
-                    elif section_type == "composition":
-                        st.markdown(f"**{content}**")
-                    elif section_type == "uses":
-                        # Format uses as bullet points if multiple
-                        if '\n' in content or ',' in content or '•' in content: # Added '•' check for robustness
-                            uses_list = content.replace('\n', ', ').split(',')
-                            for use in uses_list:
-                                if use.strip():
-                                    st.markdown(f"• {use.strip()}")
-                        else:
-                            st.markdown(content)
-                    elif section_type == "side_effects":
-                        # Format side effects with warning styling
-                        if '\n' in content or ',' in content or '•' in content: # Added '•' check for robustness
-                            effects_list = content.replace('\n', ', ').split(',')
-                            for effect in effects_list:
-                                if effect.strip():
-                                    st.markdown(f"⚠️ {effect.strip()}")
-                        else:
-                            st.markdown(f"⚠️ {content}")
-                    elif section_type == "cost":
-                        # Highlight cost information
-                        st.markdown(f"💰 **{content}**")
-                    else:
-                        st.markdown(content)
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+            for section_name, icon, section_type in SECTIONS:
+                content = drug_report.get(section_name)
+                if content:
+                    display_section(section_name, icon, section_type, content)
             
             # Display drug interaction analysis if available
             if st.session_state.interaction_analysis:
@@ -840,8 +594,19 @@ def main():
                 st.markdown(f"**Additional Medications:** {st.session_state.additional_medications}")
                 st.markdown("---")
                 
-                # Display interaction severity indicator
-                display_interaction_analysis(st.session_state.interaction_analysis)
+                # Display the pairwise grid and severity indicator, from the local table when it covers the pairs
+                known_severity = None
+                severity_grid = interaction_severity_grid(
+                    st.session_state.drug_report.composition or "",
+                    st.session_state.additional_medications
+                )
+                if severity_grid:
+                    ingredients, grid, fully_known = severity_grid
+                    if max_severity(grid) is not None:
+                        display_severity_grid(ingredients, grid)
+                    if fully_known:
+                        known_severity = max_severity(grid)
+                display_interaction_analysis(st.session_state.interaction_analysis, known_severity)
                 
                 # Display detailed interaction analysis
                 st.markdown(st.session_state.interaction_analysis)
@@ -855,22 +620,25 @@ def main():
                 st.markdown('<div class="result-header">📄 Download Report</div>', unsafe_allow_html=True)
                 st.markdown('<div class="result-content">', unsafe_allow_html=True)
                 
-                pdf_bytes = create_pdf(
-                    st.session_state.original_image,
-                    st.session_state.analysis_results,
+                # The PDF is only built when the button is clicked, and cached per report content
+                analysis_usage = st.session_state.analysis_usage
+                image = st.session_state.original_image
+                report_inputs = (
+                    st.session_state.drug_report,
                     st.session_state.interaction_analysis,
-                    st.session_state.additional_medications
+                    st.session_state.additional_medications,
+                    # Answers served from the caches cost nothing and get no usage line
+                    analysis_usage.summary() if analysis_usage and analysis_usage.model_calls else None
+                )
+                download_filename = f"mediscan_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+                st.download_button(
+                    label="📥 Download Complete PDF Report",
+                    data=lambda: cached_pdf(image.read(), *report_inputs),
+                    file_name=download_filename,
+                    mime="application/pdf",
+                    help="Download a comprehensive PDF report with all analysis results and safety information",
+                    use_container_width=True
                 )
-                if pdf_bytes:
-                    download_filename = f"mediscan_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                    st.download_button(
-                        label="📥 Download Complete PDF Report",
-                        data=pdf_bytes,
-                        file_name=download_filename,
-                        mime="application/pdf",
-                        help="Download a comprehensive PDF report with all analysis results and safety information",
-                        use_container_width=True
-                    )
                 
                 st.markdown('</div>', unsafe_allow_html=True)
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -897,7 +665,7 @@ def main():
             """, unsafe_allow_html=True)
     
     # Additional Safety Information Section
-    if st.session_state.analysis_results:
+    if st.session_state.drug_report:
         st.markdown("---")
         st.markdown('<div class="section-header">🛡️ Important Safety Guidelines</div>', unsafe_allow_html=True)
         
@@ -950,7 +718,7 @@ def main():
             """, unsafe_allow_html=True)
     
     # Key Features Section
-    if not st.session_state.analysis_results:
+    if not st.session_state.drug_report:
         st.markdown("---")
         st.markdown('<div class="section-header">✨ Key Features</div>', unsafe_allow_html=True)
         
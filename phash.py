@@ -0,0 +1,116 @@
+"""Perceptual image hashing and a BK-tree index for near-duplicate lookups."""
+import os
+import sqlite3
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import metrics
+from result_cache import DEFAULT_CACHE_PATH
+
+DEFAULT_HASH_SIZE = 8
+DEFAULT_MATCH_THRESHOLD = int(os.environ.get("MEDISCAN_PHASH_THRESHOLD", 6))
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two integer hashes."""
+    return (a ^ b).bit_count()
+
+
+@metrics.timed("phash")
+def dhash(image_bytes, hash_size=DEFAULT_HASH_SIZE):
+    """Compute a difference hash of the image as a hash_size**2-bit integer."""
+    img = Image.open(BytesIO(image_bytes))
+    # JPEG draft mode decodes at a reduced scale, which is all a hash needs
+    img.draft("L", (hash_size * 8, hash_size * 8))
+    img = ImageOps.exif_transpose(img)
+    img = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(img, dtype=np.int16)
+    diff = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(diff).tobytes(), "big")
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes using Hamming distance."""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, item_hash, value):
+        """Insert value under item_hash; equal hashes share a node."""
+        self._size += 1
+        if self._root is None:
+            self._root = (item_hash, [value], {})
+            return
+        node = self._root
+        while True:
+            node_hash, values, children = node
+            distance = hamming_distance(item_hash, node_hash)
+            if distance == 0:
+                values.append(value)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (item_hash, [value], {})
+                return
+            node = child
+
+    def search(self, item_hash, max_distance):
+        """Return (distance, value) pairs within max_distance, closest first."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_hash, values, children = stack.pop()
+            distance = hamming_distance(item_hash, node_hash)
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in values)
+            # Triangle inequality prunes every subtree outside [d - k, d + k]
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateIndex:
+    """Persistent perceptual-hash index mapping images to prior result cache keys."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, threshold=DEFAULT_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_hashes ("
+            "phash TEXT NOT NULL, result_key TEXT NOT NULL, "
+            "PRIMARY KEY (phash, result_key))"
+        )
+        for phash, result_key in self._conn.execute("SELECT phash, result_key FROM image_hashes"):
+            self._tree.add(int(phash, 16), result_key)
+
+    def __len__(self):
+        return len(self._tree)
+
+    def add(self, image_hash, result_key):
+        """Record that the image with image_hash was analyzed under result_key."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO image_hashes (phash, result_key) VALUES (?, ?)",
+                (f"{image_hash:x}", result_key),
+            )
+            if cursor.rowcount:
+                self._tree.add(image_hash, result_key)
+
+    def find(self, image_hash, threshold=None):
+        """Return (distance, result_key) matches within the threshold, closest first."""
+        if threshold is None:
+            threshold = self.threshold
+        with self._lock:
+            return self._tree.search(image_hash, threshold)
@@ -0,0 +1,158 @@
+"""Process-wide admission control for model and search API calls.
+
+Each budget is a token bucket (requests per minute) combined with a cap on calls
+in flight. Callers that cannot be admitted queue first-come, first-served, so a
+burst is spread out at the quota ceiling instead of failing with 429 errors.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+# Seconds between queue status reports to a waiting caller
+POLL_INTERVAL = 0.5
+# Assumed call duration before any call has finished
+INITIAL_SERVICE_TIME = 10.0
+
+
+class RateLimiter:
+    """Token bucket plus concurrency cap with a fair (FIFO) waiting queue."""
+
+    def __init__(self, name, requests_per_minute, max_concurrent):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._tokens = float(max_concurrent)
+        self._updated = time.monotonic()
+        self._active = 0
+        self._service_time = INITIAL_SERVICE_TIME
+        self.admitted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(float(self.max_concurrent), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _estimate_wait(self, ahead):
+        """Seconds until a caller with `ahead` callers in front of it is likely admitted."""
+        token_wait = max(0.0, ahead + 1 - self._tokens) / self.rate
+        busy = ahead + 1 + self._active - self.max_concurrent
+        slot_wait = max(0, busy) * self._service_time / self.max_concurrent
+        return max(token_wait, slot_wait)
+
+    def acquire(self, on_wait=None, timeout=None):
+        """Wait first-come, first-served for one call's worth of budget; pair with release().
+
+        While queued, on_wait(position, estimated_seconds) is called whenever the
+        rounded status changes, and on_wait(0, 0) once the call is admitted.
+        Returns an admission token for release(), or None if timeout seconds
+        pass first (the caller then leaves the queue).
+        """
+        ticket = object()
+        enqueued = time.monotonic()
+        give_up = None if timeout is None else enqueued + timeout
+        reported = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._queue[0] is ticket and self._active < self.max_concurrent and self._tokens >= 1:
+                        self._admit()
+                        break
+                    if give_up is not None and now >= give_up:
+                        self._queue.remove(ticket)
+                        self._cond.notify_all()
+                        return None
+                    ahead = self._queue.index(ticket)
+                    status = (ahead + 1, round(self._estimate_wait(ahead)))
+                    if on_wait is None or status == reported:
+                        wait = POLL_INTERVAL
+                        if ahead == 0 and self._active < self.max_concurrent:
+                            wait = min(wait, (1 - self._tokens) / self.rate)
+                        if give_up is not None:
+                            wait = min(wait, give_up - now)
+                        self._cond.wait(wait)
+                        continue
+                # Report outside the lock; the callback may be slow (e.g. a UI update)
+                on_wait(*status)
+                reported = status
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+        started = time.monotonic()
+        if reported is not None:
+            on_wait(0, 0)
+        metrics.observe(f"queue.{self.name}", started - enqueued)
+        with self._cond:
+            if started - enqueued >= POLL_INTERVAL:
+                self.waited += 1
+            self.wait_seconds += started - enqueued
+        return started
+
+    def try_acquire(self):
+        """Admit a call only if nobody is queued and budget is free right now; token or None."""
+        with self._cond:
+            self._refill(time.monotonic())
+            if self._queue or self._active >= self.max_concurrent or self._tokens < 1:
+                return None
+            self._admit()
+        return time.monotonic()
+
+    def _admit(self):
+        # Called with self._cond held, for the caller at the head of the queue (or an empty queue)
+        if self._queue:
+            self._queue.popleft()
+        self._tokens -= 1
+        self._active += 1
+        self.admitted += 1
+        self._cond.notify_all()
+
+    def release(self, started):
+        """Return the budget taken by acquire() or try_acquire()."""
+        with self._cond:
+            self._active -= 1
+            # Exponential moving average of how long calls hold a slot
+            self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, on_wait=None):
+        """Hold one call's worth of budget for the duration of the with block (see acquire())."""
+        started = self.acquire(on_wait)
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+def limiter_from_env(name, requests_per_minute, max_concurrent):
+    """RateLimiter for a budget, overridable with MEDISCAN_<NAME>_RPM and MEDISCAN_<NAME>_CONCURRENCY."""
+    prefix = f"MEDISCAN_{name.upper()}"
+    return RateLimiter(
+        name,
+        float(os.environ.get(f"{prefix}_RPM", requests_per_minute)),
+        int(os.environ.get(f"{prefix}_CONCURRENCY", max_concurrent)),
+    )
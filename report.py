@@ -0,0 +1,179 @@
+"""PDF report generation for tablet analyses."""
+import logging
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+import metrics
+from image_prep import make_thumbnail
+from result_cache import LRUCache, content_key
+
+logger = logging.getLogger(__name__)
+
+# Points (1/72 inch), i.e. 4 inches
+PDF_IMAGE_WIDTH = 4 * 72
+# 150 dpi at the 4 inch display width is plenty for print and keeps the PDF small
+PDF_IMAGE_PIXELS = 600
+PDF_CACHE_ENTRIES = 32
+
+
+@lru_cache(maxsize=None)
+def _pdf_styles():
+    """Paragraph styles, built on the first report; they are immutable and shared by every report.
+
+    reportlab is imported here rather than at module level, so the app starts
+    without it until a PDF is actually downloaded.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle(
+            'Title',
+            parent=styles['Title'],
+            fontSize=18,
+            alignment=1,
+            spaceAfter=12,
+            textColor=colors.navy
+        ),
+        "heading": ParagraphStyle(
+            'Heading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.navy,
+            spaceAfter=6
+        ),
+        "normal": ParagraphStyle(
+            'Body',
+            parent=styles['Normal'],
+            fontSize=12,
+            leading=14
+        ),
+        "disclaimer": ParagraphStyle(
+            'Disclaimer',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.red,
+            borderWidth=1,
+            borderColor=colors.red,
+            borderPadding=5,
+            backColor=colors.pink,
+            alignment=1
+        ),
+        "footer": ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.gray),
+    }
+
+
+_pdf_cache = LRUCache(max_entries=PDF_CACHE_ENTRIES)
+
+
+@metrics.timed("pdf")
+def create_pdf(image_data, report, interaction_analysis=None, additional_meds=None, usage_summary=None):
+    """Create a PDF report of a parsed DrugReport and return its bytes.
+
+    usage_summary (e.g. usage.Usage.summary()) is printed in the footer and stored
+    as the document subject.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as ReportLabImage
+
+    styles = _pdf_styles()
+    buffer = BytesIO()
+    pdf = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        title="MediScan Drug Analysis Report",
+        subject=f"Model usage: {usage_summary}" if usage_summary else "",
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    # Content to add to PDF
+    content = []
+
+    # Title
+    content.append(Paragraph("💊 MediScan - Comprehensive Drug Analysis Report", styles["title"]))
+    content.append(Spacer(1, 0.25*inch))
+
+    # Disclaimer
+    content.append(Paragraph(
+        "⚠️ MEDICAL DISCLAIMER: This information is provided for educational purposes only and should not replace professional medical advice. "
+        "Always consult with a healthcare professional before making any medical decisions or changes to your medication regimen.",
+        styles["disclaimer"]
+    ))
+    content.append(Spacer(1, 0.25*inch))
+
+    # Date and time
+    current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    content.append(Paragraph(f"📅 Generated on: {current_datetime}", styles["normal"]))
+    content.append(Spacer(1, 0.25*inch))
+
+    # Add image if available, downsampled to its printed size instead of the full upload
+    if image_data:
+        try:
+            img_temp = BytesIO(make_thumbnail(image_data, PDF_IMAGE_PIXELS, "JPEG"))
+            img_obj = ReportLabImage(img_temp)
+            aspect = img_obj.imageHeight / float(img_obj.imageWidth)
+            img_obj.drawWidth = PDF_IMAGE_WIDTH
+            img_obj.drawHeight = PDF_IMAGE_WIDTH * aspect
+            content.append(Paragraph("📸 Analyzed Image:", styles["heading"]))
+            content.append(img_obj)
+            content.append(Spacer(1, 0.25*inch))
+        except Exception as img_error:
+            logger.warning("Could not add image to PDF: %s", img_error)
+
+    # Analysis results
+    content.append(Paragraph("🔬 Drug Analysis Results:", styles["heading"]))
+
+    # Format the analysis results for PDF
+    if report:
+        for section_title, section_content in report.items():
+            content.append(Paragraph(f"<b>{section_title}:</b>", styles["normal"]))
+
+            # Handle multiline content
+            paragraphs = section_content.split("\n")
+            for para in paragraphs:
+                if para.strip():
+                    # Escape HTML characters for ReportLab
+                    clean_para = para.strip().replace('<', '&lt;').replace('>', '&gt;')
+                    content.append(Paragraph(clean_para, styles["normal"]))
+
+            content.append(Spacer(1, 0.15*inch))
+
+    # Drug interaction analysis
+    if interaction_analysis and additional_meds:
+        content.append(Paragraph("💊 Drug Interaction Analysis:", styles["heading"]))
+        content.append(Paragraph(f"<b>Additional Medications:</b> {additional_meds}", styles["normal"]))
+        content.append(Spacer(1, 0.1*inch))
+
+        clean_interaction = interaction_analysis.replace('<', '&lt;').replace('>', '&gt;')
+        content.append(Paragraph(clean_interaction, styles["normal"]))
+        content.append(Spacer(1, 0.25*inch))
+
+    # Footer
+    content.append(Spacer(1, 0.5*inch))
+    content.append(Paragraph("© 2025 MediScan - Comprehensive Drug Analyzer | Powered by Gemini AI + Tavily", styles["footer"]))
+    if usage_summary:
+        content.append(Paragraph(f"Model usage: {usage_summary}", styles["footer"]))
+
+    # Build PDF
+    pdf.build(content)
+
+    # Get the PDF value from the buffer
+    buffer.seek(0)
+    return buffer.getvalue()
+
+
+def cached_pdf(image_data, report, interaction_analysis=None, additional_meds=None, usage_summary=None):
+    """Return report bytes, building the PDF only the first time these inputs are seen."""
+    cache_key = content_key(image_data, report.raw if report else None, interaction_analysis, additional_meds,
+                            usage_summary)
+    pdf_bytes = _pdf_cache.get(cache_key)
+    if pdf_bytes is None:
+        pdf_bytes = create_pdf(image_data, report, interaction_analysis, additional_meds, usage_summary)
+        _pdf_cache.set(cache_key, pdf_bytes)
+    return pdf_bytes
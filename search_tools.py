@@ -0,0 +1,130 @@
+"""Tavily search tools with a shared on-disk result cache and a pooled HTTP session."""
+import os
+import re
+import threading
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from hedging import REQUEST_DEADLINE_SECONDS, STAGE_SHARES
+from result_cache import ResultCache, content_key
+
+SEARCH_CACHE_TTL = int(os.environ.get("MEDISCAN_SEARCH_CACHE_TTL", 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("MEDISCAN_SEARCH_CACHE_MAX_ENTRIES", 20000))
+HTTP_POOL_SIZE = 16
+# Each search's share of the request deadline
+SEARCH_TIMEOUT = REQUEST_DEADLINE_SECONDS * STAGE_SHARES["search"]
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Case-, punctuation- and whitespace-insensitive form of a search query."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.casefold())).strip()
+
+
+class SearchPool:
+    """Search state shared by every agent: result cache, HTTP connection pool and call counters."""
+
+    def __init__(self, api_key, cache=None, pool_size=HTTP_POOL_SIZE, limiter=None, client=None):
+        self.api_key = api_key
+        # Optional RateLimiter every upstream search is admitted through
+        self.limiter = limiter
+        self.cache = cache if cache is not None else ResultCache(
+            table="search_results", ttl_seconds=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        # client stands in for the real TavilyClient, e.g. fake_models.FakeSearchClient
+        self._client = _TimedClient(client, SEARCH_TIMEOUT) if client is not None else None
+        self.searches = 0
+        self.upstream_searches = 0
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The Tavily client, created (and the tavily package imported) on first use."""
+        if self._client is None:
+            from tavily import TavilyClient
+
+            with self._lock:
+                if self._client is None:
+                    self._client = _TimedClient(TavilyClient(api_key=self.api_key, session=self.session), SEARCH_TIMEOUT)
+        return self._client
+
+    def tools(self):
+        """A Tavily toolkit for one agent, backed by this pool."""
+        return cached_tavily_tools()(self)
+
+    def count(self, upstream):
+        with self._lock:
+            self.searches += 1
+            if upstream:
+                self.upstream_searches += 1
+
+    def stats(self):
+        """Tool call counts plus the cache hit/miss counters."""
+        stats = self.cache.stats()
+        stats.update(searches=self.searches, upstream_searches=self.upstream_searches)
+        return stats
+
+
+class _TimedClient:
+    """TavilyClient facade that gives every search the same timeout."""
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.timeout = timeout
+
+    def search(self, **kwargs):
+        return self.client.search(timeout=self.timeout, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def cached_tavily_tools():
+    """The CachedTavilyTools class, defined on first use because phi's toolkit is slow to import."""
+    from phi.tools.tavily import TavilyTools
+
+    class CachedTavilyTools(TavilyTools):
+        """Drop-in TavilyTools whose searches are deduplicated through a SearchPool."""
+
+        def __init__(self, pool, **kwargs):
+            super().__init__(api_key=pool.api_key, **kwargs)
+            self.pool = pool
+            self.client = pool.client
+
+        def web_search_using_tavily(self, query: str, max_results: int = 5) -> str:
+            """Use this function to search the web for a given query.
+            This function uses the Tavily API to provide realtime online information about the query.
+
+            Args:
+                query (str): Query to search for.
+                max_results (int): Maximum number of results to return. Defaults to 5.
+
+            Returns:
+                str: JSON string of results related to the query.
+            """
+            cache_key = content_key(
+                "tavily", self.search_depth, self.format, str(self.include_answer), str(max_results),
+                normalize_query(query),
+            )
+            cached = self.pool.cache.get(cache_key)
+            if cached is not None:
+                self.pool.count(upstream=False)
+                return cached
+            with metrics.span("search"):
+                if self.pool.limiter is not None:
+                    with self.pool.limiter.slot():
+                        result = super().web_search_using_tavily(query, max_results)
+                else:
+                    result = super().web_search_using_tavily(query, max_results)
+            self.pool.count(upstream=True)
+            if result:
+                self.pool.cache.set(cache_key, result)
+            return result
+
+    return CachedTavilyTools
@@ -0,0 +1,47 @@
+"""In-process request coalescing: concurrent calls with the same key share one computation."""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs fn once per key at a time; callers arriving while it runs wait for the same result.
+
+    Nothing is remembered after a call finishes; durable reuse is the result caches' job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return (result, shared), where shared is True if another caller's run was reused.
+
+        Exceptions raised by fn reach every waiting caller.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def inflight(self):
+        """Number of computations currently running."""
+        with self._lock:
+            return len(self._inflight)
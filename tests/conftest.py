@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from PIL import Image
+
+from core import DrugAnalyzer
+from fake_models import FakeModel, FakeSearchClient
+from phash import NearDuplicateIndex
+from result_cache import ResultCache
+from search_tools import SearchPool
+from usage import UsageLedger
+
+
+@pytest.fixture
+def make_analyzer(tmp_path):
+    """Build an offline DrugAnalyzer whose caches all live in tmp_path; reply functions feed the fake models."""
+    path = str(tmp_path / "cache.sqlite3")
+
+    def make(composition_reply=None, analysis_reply=None, **kwargs):
+        return DrugAnalyzer(
+            "google-key", "tavily-key",
+            result_cache=ResultCache(path),
+            section_cache=ResultCache(path, table="composition_sections"),
+            interaction_cache=ResultCache(path, table="interaction_pairs"),
+            duplicate_index=NearDuplicateIndex(path),
+            usage_ledger=UsageLedger(path),
+            search_pool=SearchPool("tavily-key", client=FakeSearchClient()),
+            composition_model=lambda: FakeModel(reply=composition_reply),
+            analysis_model=lambda: FakeModel(reply=analysis_reply),
+            **kwargs,
+        )
+
+    return make
+
+
+@pytest.fixture
+def tablet_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, "JPEG")
+    return buffer.getvalue()
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import batch
+
+
+def test_find_images_walks_in_stable_order(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ("b/2.JPG", "b/1.png", "a.webp", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    found = [path[len(str(tmp_path)) + 1:] for path in batch.find_images(str(tmp_path))]
+    assert found == ["a.webp", "b/1.png", "b/2.JPG"]
+
+
+def test_load_completed_skips_failures_and_torn_lines(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(
+        json.dumps({"path": "ok.jpg", "status": "ok"}) + "\n"
+        + json.dumps({"path": "bad.jpg", "status": "error"}) + "\n"
+        + '{"path": "torn.jpg", "sta'
+    )
+    assert batch.load_completed(str(output)) == {"ok.jpg"}
+    assert batch.load_completed(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_with_retries_returns_the_attempt_count(monkeypatch):
+    monkeypatch.setattr(batch.time, "sleep", lambda seconds: None)
+    failures = iter([RuntimeError("429"), RuntimeError("503")])
+
+    def flaky():
+        error = next(failures, None)
+        if error:
+            raise error
+        return "analysis"
+
+    assert batch.with_retries(flaky, retries=3, backoff=1) == ("analysis", 3)
+
+
+def test_with_retries_gives_up(monkeypatch):
+    monkeypatch.setattr(batch.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        batch.with_retries(down, retries=2, backoff=1)
+    assert len(calls) == 3
+
+
+def test_with_retries_does_not_retry_permanent_errors(monkeypatch):
+    monkeypatch.setattr(batch.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def too_large():
+        calls.append(1)
+        raise batch.ImageTooLarge("too large")
+
+    with pytest.raises(batch.ImageTooLarge):
+        batch.with_retries(too_large, retries=3, backoff=1)
+    assert len(calls) == 1
+
+
+def test_analyze_image_record(make_analyzer, tablet_image, tmp_path):
+    path = tmp_path / "tablet.jpg"
+    path.write_bytes(tablet_image)
+    record = batch.analyze_image(make_analyzer(), str(path), "Aspirin", retries=0, backoff=0)
+    assert record["status"] == "ok"
+    assert record["sections"]["Composition"] == "Paracetamol 500mg"
+    assert "+ aspirin" in record["interactions"].lower()
+    assert record["usage"]["model_calls"] == 5
+
+
+def test_analyze_image_records_errors(make_analyzer, tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    record = batch.analyze_image(make_analyzer(), str(path), "", retries=0, backoff=0)
+    assert record["status"] == "error"
+    assert "error" in record
@@ -0,0 +1,61 @@
+import gc
+import os
+
+import pytest
+
+from blob_store import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"), memory_bytes=1_000)
+
+
+def test_identical_content_is_stored_once(store):
+    first, second = store.put(b"image"), store.put(b"image")
+    assert first.digest == second.digest
+    assert store.stats()["blobs"] == 1
+    assert store.stats()["references"] == 2
+    assert len(os.listdir(store.directory)) == 1
+
+
+def test_blob_is_deleted_with_its_last_reference(store):
+    first, second = store.put(b"image"), store.put(b"image")
+    digest = first.digest
+    del first
+    gc.collect()
+    assert store.get(digest) == b"image"
+    del second
+    gc.collect()
+    assert store.get(digest) is None
+    assert store.stats()["blobs"] == 0
+    assert store.stats()["memory_bytes"] == 0
+    assert os.listdir(store.directory) == []
+
+
+def test_release_while_the_lock_is_held_is_deferred(store):
+    ref = store.put(b"image")
+    digest = ref.digest
+    # Garbage collection may finalize a reference on a thread inside a store call
+    with store._lock:
+        del ref
+        gc.collect()
+    assert store.get(digest) is None
+    assert os.listdir(store.directory) == []
+
+
+def test_large_blobs_are_served_from_disk(store):
+    ref = store.put(b"x" * 2_000)
+    data = ref.read()
+    assert bytes(data) == b"x" * 2_000
+    assert store.stats()["memory_blobs"] == 0
+    assert store.stats()["disk_reads"] == 1
+    data.close()
+
+
+def test_memory_tier_evicts_least_recently_used(store):
+    first = store.put(b"a" * 600)
+    second = store.put(b"b" * 600)
+    assert store.stats()["memory_blobs"] == 1
+    assert bytes(first.read()) == b"a" * 600
+    assert second.read() == b"b" * 600
@@ -0,0 +1,131 @@
+import io
+import json
+import logging
+
+from PIL import Image
+
+from core import (DRUG_INTERACTION_PROMPT, INSTRUCTIONS, JSON_RESEARCH_INSTRUCTIONS, RESEARCH_INSTRUCTIONS,
+                  RESPONSE_SCHEMA, SECTIONS, STRENGTH_DEPENDENT_SECTIONS, SYSTEM_PROMPT, DrugReport,
+                  analysis_cache_key)
+from fake_models import canned_reply, requested_sections
+
+SAFETY_SECTIONS = ["Safety with Alcohol", "Pregnancy Safety", "Breastfeeding Safety", "Driving Safety",
+                   "General Safety Advice"]
+
+
+def system_message(agent):
+    return agent.get_system_message().content
+
+
+def test_analysis_agent_gets_its_instructions(make_analyzer):
+    analyzer = make_analyzer()
+    message = system_message(analyzer.create_agent())
+    assert SYSTEM_PROMPT.strip() in message
+    assert INSTRUCTIONS.strip() in message
+    assert RESEARCH_INSTRUCTIONS in system_message(analyzer.create_agent(RESEARCH_INSTRUCTIONS))
+
+
+def test_structured_agent_gets_the_json_schema(make_analyzer):
+    analyzer = make_analyzer(structured_output=True)
+    message = system_message(analyzer.create_agent())
+    assert json.dumps(RESPONSE_SCHEMA, indent=2) in message
+    assert "Use markdown" not in message
+    assert JSON_RESEARCH_INSTRUCTIONS in system_message(analyzer.create_agent(JSON_RESEARCH_INSTRUCTIONS))
+
+
+def test_interaction_agent_is_asked_for_markdown(make_analyzer):
+    message = system_message(make_analyzer().create_interaction_agent())
+    assert DRUG_INTERACTION_PROMPT.strip() in message
+    assert "Use markdown" in message
+
+
+def test_structured_analysis_is_parsed_as_json(make_analyzer, tablet_image, caplog):
+    analyzer = make_analyzer(structured_output=True, cascade=False)
+    with caplog.at_level(logging.WARNING):
+        report = DrugReport.parse(analyzer.extract_composition_and_details(tablet_image))
+    assert report.missing() == []
+    assert "not valid JSON" not in caplog.text
+
+
+def test_cascade_report_is_complete(make_analyzer, tablet_image):
+    report = DrugReport.parse(make_analyzer().extract_composition_and_details(tablet_image))
+    assert report.composition == "Paracetamol 500mg"
+    assert report.missing() == []
+
+
+def test_cascade_reports_composition_before_research(make_analyzer, tablet_image):
+    events = []
+
+    def research(messages):
+        events.append("research")
+        return canned_reply(messages)
+
+    make_analyzer(analysis_reply=research).extract_composition_and_details(
+        tablet_image,
+        on_progress=lambda text: events.append(len(DrugReport.parse(text).items())),
+        on_composition=lambda composition: events.append(composition),
+    )
+    assert events[:2] == ["Paracetamol 500mg", 1]
+    assert events[-1] == 11
+
+
+def test_partial_report_is_not_cached(make_analyzer, tablet_image):
+    failures = {"remaining": 1}
+    researched = []
+
+    def flaky_safety_research(messages):
+        sections = requested_sections(messages)
+        researched.extend(sections)
+        if "Pregnancy Safety" in sections and failures["remaining"]:
+            failures["remaining"] -= 1
+            raise RuntimeError("search backend down")
+        return canned_reply(messages)
+
+    analyzer = make_analyzer(analysis_reply=flaky_safety_research)
+    first = DrugReport.parse(analyzer.extract_composition_and_details(tablet_image))
+    assert first.missing() == SAFETY_SECTIONS
+    assert analyzer.result_cache.get(analysis_cache_key(tablet_image, analyzer.prompt_version())) is None
+
+    researched.clear()
+    second = DrugReport.parse(analyzer.extract_composition_and_details(tablet_image))
+    assert second.missing() == []
+    # Only the failed group is researched again; the others come from the section cache
+    assert sorted(researched) == sorted(SAFETY_SECTIONS)
+
+    researched.clear()
+    assert analyzer.extract_composition_and_details(tablet_image) == second.to_text()
+    assert researched == []
+
+
+def test_strength_dependent_sections_are_keyed_on_strength(make_analyzer):
+    researched = []
+
+    def research(messages):
+        researched.extend(requested_sections(messages))
+        return canned_reply(messages)
+
+    def image(colour):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), colour).save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    make_analyzer(composition_reply=lambda messages: "Paracetamol 500mg", analysis_reply=research) \
+        .extract_composition_and_details(image("red"))
+    researched.clear()
+    report = DrugReport.parse(
+        make_analyzer(composition_reply=lambda messages: "Paracetamol 650mg", analysis_reply=research)
+        .extract_composition_and_details(image("blue"))
+    )
+    assert report.composition == "Paracetamol 650mg"
+    assert sorted(researched) == sorted(STRENGTH_DEPENDENT_SECTIONS)
+
+
+def test_structured_research_falls_back_to_key_value_text(make_analyzer, tablet_image):
+    def research(messages):
+        # Valid JSON, but none of the schema's fields
+        return '{"note": "usual format"}\n' + "\n".join(f"*{name}:* Sample {name.lower()}." for name, _, _ in SECTIONS)
+
+    report = DrugReport.parse(
+        make_analyzer(structured_output=True, analysis_reply=research).extract_composition_and_details(tablet_image)
+    )
+    assert report.missing() == []
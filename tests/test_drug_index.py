@@ -0,0 +1,65 @@
+from drug_index import DrugIndex, brand_key, composition_key, ingredient_key, split_ingredients
+
+RECORDS = [
+    {"composition": "Paracetamol 500mg", "tablet_names": ["Crocin", "Dolo-650"], "uses": "Fever"},
+    {"composition": "Paracetamol 500mg + Caffeine 65mg", "tablet_names": ["Crocin Advance", "Saridon"],
+     "uses": "Headache"},
+    {"composition": "Ibuprofen 400mg", "tablet_names": "Brufen, Ibugesic", "uses": "Pain"},
+]
+
+
+def make_index(tmp_path, records=RECORDS):
+    index = DrugIndex(str(tmp_path / "drugs.sqlite3"))
+    index.add_records(records)
+    return index
+
+
+def test_keys_ignore_strength_order_and_noise():
+    assert split_ingredients("Caffeine 65mg + Paracetamol IP 500 mg") == ["caffeine", "paracetamol"]
+    assert ingredient_key("Paracetamol 500mg, Caffeine") == "caffeine+paracetamol"
+    assert composition_key("Paracetamol 500 mg + Caffeine 65mg") == "caffeine 65mg+paracetamol 500mg"
+    assert brand_key("Brufen 400") == brand_key("Brufen 400mg Tablets") == "brufen"
+    assert brand_key("Dolo-650") == "dolo"
+
+
+def test_single_ingredient_never_matches_a_combination(tmp_path):
+    index = make_index(tmp_path)
+    assert index.lookup("Paracetamol")["uses"] == "Fever"
+    assert index.lookup("Caffeine 65mg + Paracetamol")["uses"] == "Headache"
+    assert index.lookup("Caffeine") is None
+
+
+def test_combination_never_matches_a_single_ingredient(tmp_path):
+    index = make_index(tmp_path, RECORDS[1:])
+    assert index.lookup("Paracetamol 650mg") is None
+    assert index.lookup("Ibuprofen + Paracetamol") is None
+
+
+def test_brand_names_match_whole_with_strength_stripped(tmp_path):
+    index = make_index(tmp_path)
+    assert index.lookup("Brufen 400")["composition"] == "Ibuprofen 400mg"
+    assert index.lookup("Dolo 650")["uses"] == "Fever"
+    assert index.lookup("Crocin")["uses"] == "Fever"
+    assert index.lookup("Crocin Advance")["uses"] == "Headache"
+    assert index.lookup("Advance") is None
+
+
+def test_brand_shared_by_two_compositions_is_ambiguous(tmp_path):
+    index = make_index(tmp_path, RECORDS + [{"composition": "Aspirin 75mg", "tablet_names": "Saridon"}])
+    assert index.lookup("Saridon") is None
+
+
+def test_reload_replaces_entries_and_version(tmp_path):
+    index = make_index(tmp_path)
+    version = index.version
+    index.add_records([{"composition": "Ibuprofen", "tablet_names": "Combiflam Junior", "uses": "Fever"}])
+    assert len(index) == 3
+    assert index.version != version
+    assert index.lookup("Combiflam Junior")["uses"] == "Fever"
+    assert index.lookup("Brufen") is None
+
+
+def test_search_is_prefix_over_names(tmp_path):
+    index = make_index(tmp_path)
+    assert [entry["uses"] for entry in index.search("brufe")] == ["Pain"]
+    assert index.search("!!") == []
@@ -0,0 +1,61 @@
+from core import SECTION_FIELDS, DrugReport, parse_sections
+
+RESPONSE = """Here is the analysis.
+*Composition:* Paracetamol 500mg
+**Uses:** Fever and mild pain.
+Second line of uses.
+*side effects:* Rare liver injury at high doses.
+*Composition:* Ignored duplicate
+"""
+
+
+def test_parse_reads_both_header_styles_case_insensitively():
+    report = DrugReport.parse(RESPONSE)
+    assert report.composition == "Paracetamol 500mg"
+    assert report.uses == "Fever and mild pain.\nSecond line of uses."
+    assert report.get("Side Effects") == "Rare liver injury at high doses."
+    assert report.raw == RESPONSE
+
+
+def test_first_occurrence_of_a_section_wins():
+    assert DrugReport.parse(RESPONSE).composition == "Paracetamol 500mg"
+
+
+def test_missing_sections_in_display_order():
+    missing = DrugReport.parse(RESPONSE).missing()
+    assert missing[0] == "Available Tablet Names"
+    assert "Composition" not in missing
+    assert len(missing) == len(SECTION_FIELDS) - 3
+
+
+def test_to_text_round_trips():
+    report = DrugReport.parse(RESPONSE)
+    assert DrugReport.parse(report.to_text()).as_dict() == report.as_dict()
+    assert list(report.as_dict()) == ["Composition", "Uses", "Side Effects"]
+
+
+def test_parse_sections_keeps_the_streaming_tail():
+    assert parse_sections("*Composition:* Paracetamol 500mg\n*Uses:* Fev") == [
+        ("Composition", "Paracetamol 500mg"), ("Uses", "Fev")
+    ]
+    assert parse_sections("no headers yet") == []
+
+
+def test_from_json_tolerates_fences_and_coerces_values():
+    report = DrugReport.from_json('```json\n{"composition": "Paracetamol 500mg", "cost": 12, '
+                                  '"tablet_names": ["Crocin", "", "Dolo"], "uses": "  "}\n```')
+    assert report.composition == "Paracetamol 500mg"
+    assert report.cost == "12"
+    assert report.tablet_names == "Crocin, Dolo"
+    assert report.uses is None
+
+
+def test_from_json_rejects_text_without_an_object():
+    assert DrugReport.from_json("no json here") is None
+    assert DrugReport.from_json("{not: valid}") is None
+    assert DrugReport.from_json("[1, 2]") is None
+
+
+def test_from_json_rejects_objects_without_known_fields():
+    assert DrugReport.from_json("{}") is None
+    assert DrugReport.from_json('{"drug": "Crocin", "uses": "  "}') is None
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hedging import Deadline, DeadlineExceeded, LatencyHistogram, MIN_SAMPLES, STAGE_SHARES, hedged_call
+from rate_limit import RateLimiter
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        yield pool
+
+
+def fast_history(seconds=0.01):
+    histogram = LatencyHistogram()
+    for _ in range(MIN_SAMPLES):
+        histogram.record(seconds)
+    return histogram
+
+
+def slow_primary(calls, primary_seconds=0.5):
+    def fn(hedge):
+        calls.append(hedge)
+        time.sleep(0.01 if hedge else primary_seconds)
+        return "hedge" if hedge else "primary"
+    return fn
+
+
+def test_stage_deadline_never_outlives_the_request():
+    request = Deadline.for_request(10)
+    assert request.stage("vision", total=10).remaining() == pytest.approx(10 * STAGE_SHARES["vision"], abs=0.05)
+    short = Deadline(0.5)
+    assert short.stage("vision", total=10).remaining() <= 0.5
+
+
+def test_stages_draw_down_one_request_budget():
+    request = Deadline.for_request(0.3)
+    time.sleep(0.2)
+    assert request.stage("vision", total=10).remaining() <= 0.1
+
+
+def test_no_hedge_without_latency_history(executor):
+    calls = []
+    assert hedged_call(executor, slow_primary(calls, 0.05), Deadline(5), LatencyHistogram()) == "primary"
+    assert calls == [False]
+
+
+def test_slow_call_is_hedged_and_first_answer_wins(executor):
+    calls = []
+    assert hedged_call(executor, slow_primary(calls), Deadline(5), fast_history()) == "hedge"
+    assert calls == [False, True]
+
+
+def test_failed_attempt_waits_for_the_other(executor):
+    def fn(hedge):
+        if hedge:
+            raise RuntimeError("hedge failed")
+        time.sleep(0.1)
+        return "primary"
+
+    assert hedged_call(executor, fn, Deadline(5), fast_history()) == "primary"
+
+
+def test_error_is_raised_when_every_attempt_fails(executor):
+    def fn(hedge):
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        hedged_call(executor, fn, Deadline(5), fast_history())
+
+
+def test_deadline_exceeded(executor):
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(executor, lambda hedge: time.sleep(1), Deadline(0.1))
+    assert time.monotonic() - started < 0.5
+
+
+def test_hedge_takes_its_own_limiter_slot(executor):
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=2)
+    calls = []
+    assert hedged_call(executor, slow_primary(calls), Deadline(5), fast_history(), limiter=limiter) == "hedge"
+    assert limiter.stats()["admitted"] == 2
+    # The abandoned primary keeps its slot until it actually finishes
+    assert limiter.stats()["active"] == 1
+    time.sleep(0.6)
+    assert limiter.stats()["active"] == 0
+
+
+def test_hedge_is_skipped_when_no_slot_is_free(executor):
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    calls = []
+    assert hedged_call(executor, slow_primary(calls, 0.1), Deadline(5), fast_history(), limiter=limiter) == "primary"
+    assert calls == [False]
+    assert limiter.stats()["admitted"] == 1
+
+
+def test_deadline_covers_the_limiter_queue(executor):
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    held = limiter.acquire()
+    calls = []
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(executor, slow_primary(calls), Deadline(0.1), limiter=limiter)
+    assert calls == []
+    assert limiter.stats()["queued"] == 0
+    limiter.release(held)
+
+
+def test_concurrent_hedged_calls_respect_the_cap(executor):
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=2)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def fn(hedge):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return hedge
+
+    histogram = fast_history(0.001)
+    callers = [
+        threading.Thread(target=hedged_call, args=(executor, fn, Deadline(5), histogram), kwargs={"limiter": limiter})
+        for _ in range(4)
+    ]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    time.sleep(0.1)
+    assert peak <= 2
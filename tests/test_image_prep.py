@@ -0,0 +1,80 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import image_prep
+from image_prep import MAX_MODEL_IMAGE_EDGE, make_thumbnail, prepare_for_model
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def jpeg(size, orientation=1, quality=90):
+    img = Image.radial_gradient("L").convert("RGB").resize(size)
+    exif = img.getexif()
+    exif[_EXIF_ORIENTATION] = orientation
+    buffer = BytesIO()
+    img.save(buffer, "JPEG", quality=quality, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def decoded_sizes(monkeypatch):
+    """Sizes images come out of the JPEG decoder at, before EXIF orientation is applied."""
+    sizes = []
+    transpose = image_prep.ImageOps.exif_transpose
+
+    def record(img, **kwargs):
+        sizes.append(img.size)
+        return transpose(img, **kwargs)
+
+    monkeypatch.setattr(image_prep.ImageOps, "exif_transpose", record)
+    return sizes
+
+
+@pytest.mark.parametrize("size", [(4000, 3000), (4032, 3024), (4000, 2250), (3000, 4000)])
+@pytest.mark.parametrize("orientation", [1, 6])
+def test_camera_frames_are_decoded_at_reduced_scale(decoded_sizes, size, orientation):
+    prepared = Image.open(BytesIO(prepare_for_model(jpeg(size, orientation))))
+    decoded = decoded_sizes[0]
+    assert decoded == (size[0] // 2, size[1] // 2)
+    assert max(prepared.size) == MAX_MODEL_IMAGE_EDGE
+    upright = size if orientation == 1 else size[::-1]
+    assert (prepared.width > prepared.height) == (upright[0] > upright[1])
+
+
+def test_output_fits_the_byte_budget():
+    prepared = prepare_for_model(jpeg((3000, 2000)), byte_budget=60_000)
+    assert len(prepared) <= 60_000
+    assert Image.open(BytesIO(prepared)).format == "JPEG"
+
+
+def test_small_upright_jpeg_is_sent_untouched():
+    small = jpeg((800, 600))
+    assert prepare_for_model(small) is small
+
+
+def test_transparent_png_is_flattened_to_jpeg():
+    buffer = BytesIO()
+    Image.new("RGBA", (300, 200), (0, 0, 0, 0)).save(buffer, "PNG")
+    prepared = Image.open(BytesIO(prepare_for_model(buffer.getvalue())))
+    assert prepared.mode == "RGB"
+    assert prepared.getpixel((0, 0)) == (255, 255, 255)
+
+
+@pytest.mark.parametrize("orientation", [1, 3, 6, 8])
+def test_thumbnail_is_upright_at_the_requested_width(decoded_sizes, orientation):
+    thumbnail = Image.open(BytesIO(make_thumbnail(jpeg((4000, 1000), orientation), 600)))
+    if orientation in (6, 8):
+        assert thumbnail.size == (600, 2400)
+        # Never decoded below the displayed width, so nothing is upscaled
+        assert decoded_sizes[0][1] >= 600
+    else:
+        assert thumbnail.size == (600, 150)
+        assert decoded_sizes[0][0] >= 600
+
+
+def test_thumbnail_formats():
+    upload = jpeg((1200, 900))
+    assert Image.open(BytesIO(make_thumbnail(upload, 300, "JPEG"))).format == "JPEG"
+    assert Image.open(BytesIO(make_thumbnail(upload, 300))).size == (300, 225)
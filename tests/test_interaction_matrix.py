@@ -0,0 +1,61 @@
+import pytest
+
+from interaction_matrix import InteractionMatrix, max_severity
+
+
+@pytest.fixture
+def matrix():
+    matrix = InteractionMatrix()
+    matrix.add("Warfarin 5mg", "Aspirin", "Major", "Additive bleeding risk", "Avoid")
+    matrix.add("aspirin", "Ibuprofen", "moderate")
+    return matrix
+
+
+def test_pairs_are_symmetric_and_canonical(matrix):
+    assert matrix.lookup("warfarin", "aspirin") == ("Major", "Additive bleeding risk", "Avoid")
+    assert matrix.lookup("aspirin", "warfarin") == matrix.lookup("warfarin", "aspirin")
+    assert matrix.lookup("ibuprofen", "aspirin") == ("Moderate", "", "")
+    assert matrix.lookup("warfarin", "ibuprofen") is None
+    assert matrix.lookup("warfarin", "unknown") is None
+    assert sorted(matrix.ingredient_names()) == ["aspirin", "ibuprofen", "warfarin"]
+
+
+def test_add_replaces_an_existing_pair(matrix):
+    matrix.add("Aspirin", "Warfarin", "Severe")
+    assert len(matrix) == 2
+    assert matrix.lookup("warfarin", "aspirin") == ("Severe", "", "")
+
+
+def test_add_rejects_combinations_and_unknown_severities(matrix):
+    with pytest.raises(ValueError, match="single ingredients"):
+        matrix.add("Paracetamol + Caffeine", "Aspirin", "Minor")
+    with pytest.raises(ValueError, match="Unknown severity"):
+        matrix.add("Paracetamol", "Aspirin", "Deadly")
+
+
+def test_load_csv(tmp_path):
+    path = tmp_path / "interactions.csv"
+    path.write_text("drug_a,drug_b,severity,mechanism,recommendation\n"
+                    "Warfarin,Aspirin,Major,Bleeding,\n"
+                    "Aspirin,Ibuprofen,Minor,,\n", encoding="utf-8")
+    matrix = InteractionMatrix()
+    assert matrix.load_csv(str(path)) == 2
+    assert matrix.lookup("aspirin", "warfarin") == ("Major", "Bleeding", "")
+
+
+def test_grid_and_max_severity(matrix):
+    grid = matrix.grid(["warfarin", "aspirin", "ibuprofen", "unknown"])
+    assert grid[0] == [None, "Major", None, None]
+    assert grid[1] == ["Major", None, "Moderate", None]
+    assert [row[3] for row in grid] == [None] * 4
+    assert max_severity(grid) == "Major"
+    assert max_severity(matrix.grid(["warfarin", "unknown"])) is None
+
+
+def test_describe_needs_every_ingredient_pair(matrix):
+    summary = matrix.describe("Warfarin 5mg", "Aspirin 75mg")
+    assert summary.startswith("**Warfarin + Aspirin: Major interaction**")
+    assert "Mechanism: Additive bleeding risk" in summary
+    assert "Recommendation: Avoid" in summary
+    assert matrix.describe("Aspirin + Warfarin", "Ibuprofen") is None
+    assert matrix.describe("Aspirin", "Aspirin") is None
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from interactions import InteractionEngine, canonical_name, merge_pair_reports, split_medications
+from result_cache import ResultCache
+
+
+class FakePairAgent:
+    """run_pair stand-in that records the pairs it was asked about."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.asked = []
+        self._lock = threading.Lock()
+
+    def __call__(self, primary, other, deadline=None):
+        with self._lock:
+            self.asked.append(other)
+        if other in self.fail:
+            raise RuntimeError(f"{other} lookup failed")
+        return f"{primary} with {other}: minor."
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache.sqlite3"), table="interaction_pairs")
+
+
+def test_split_medications_dedupes_in_input_order():
+    assert split_medications("Aspirin 75mg, metformin; ASPIRIN 75mg.\nLisinopril") == [
+        "Aspirin 75mg", "metformin", "Lisinopril"
+    ]
+    assert canonical_name("  Aspirin   75mg. ") == "aspirin 75mg"
+
+
+def test_each_pair_is_cached_separately(cache):
+    agent = FakePairAgent()
+    engine = InteractionEngine(agent, cache)
+    engine.analyze("Paracetamol 500mg", "Aspirin, Metformin")
+    engine.analyze("Paracetamol 500mg", "metformin, Lisinopril")
+    assert sorted(agent.asked) == ["Aspirin", "Lisinopril", "Metformin"]
+
+
+def test_report_follows_medication_order(cache):
+    report = InteractionEngine(FakePairAgent(), cache).analyze("Paracetamol", "Metformin, Aspirin")
+    assert report.index("#### Paracetamol + Metformin") < report.index("#### Paracetamol + Aspirin")
+
+
+def test_failed_pair_is_reported_and_not_cached(cache):
+    agent = FakePairAgent(fail={"Aspirin"})
+    engine = InteractionEngine(agent, cache)
+    report = engine.analyze("Paracetamol", "Aspirin, Metformin")
+    assert "Interaction analysis unavailable for this pair: Aspirin lookup failed" in report
+    agent.fail.clear()
+    engine.analyze("Paracetamol", "Aspirin, Metformin")
+    assert agent.asked.count("Aspirin") == 2
+    assert agent.asked.count("Metformin") == 1
+
+
+def test_error_is_raised_when_every_pair_fails(cache):
+    engine = InteractionEngine(FakePairAgent(fail={"Aspirin"}), cache)
+    with pytest.raises(RuntimeError, match="Aspirin lookup failed"):
+        engine.analyze("Paracetamol", "Aspirin")
+
+
+def test_empty_list_needs_no_agent(cache):
+    agent = FakePairAgent()
+    assert InteractionEngine(agent, cache).analyze("Paracetamol", " , ") is None
+    assert agent.asked == []
+
+
+def test_medications_key_ignores_order_and_spelling(cache):
+    engine = InteractionEngine(FakePairAgent(), cache)
+    assert engine.medications_key("Aspirin, Metformin") == engine.medications_key("metformin ,  ASPIRIN")
+
+
+def test_merge_pair_reports_marks_missing_results():
+    report = merge_pair_reports("A", ["B"], {"B": ""})
+    assert report == "#### A + B\n\nNo interaction information returned."
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import jobs
+from jobs import JobManager
+
+
+def wait_for(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not manager.get(job_id).done:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+    return manager.get(job_id)
+
+
+def test_job_reports_progress_and_result():
+    manager = JobManager(max_workers=1)
+
+    def work(job, value):
+        job.set_progress("halfway")
+        return value * 2
+
+    job = wait_for(manager, manager.submit(work, 21))
+    assert (job.status, job.progress, job.result, job.error) == (jobs.DONE, "halfway", 42, None)
+    assert manager.stats() == {jobs.DONE: 1}
+    manager.discard(job.id)
+    assert manager.get(job.id) is None
+
+
+def test_failure_is_recorded():
+    manager = JobManager(max_workers=1)
+
+    def work(job):
+        raise RuntimeError("boom")
+
+    job = wait_for(manager, manager.submit(work))
+    assert job.status == jobs.FAILED
+    assert str(job.error) == "boom"
+
+
+def test_cancelled_jobs_never_run_or_keep_their_result():
+    manager = JobManager(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    ran = []
+
+    def blocking(job):
+        started.set()
+        release.wait(5)
+        job.set_progress("late")
+        return "discarded"
+
+    running = manager.submit(blocking)
+    queued = manager.submit(lambda job: ran.append(job.id))
+    started.wait(5)
+    assert manager.cancel(queued)
+    assert manager.cancel(running)
+    release.set()
+    # One worker, so this runs only after the detached job has returned
+    wait_for(manager, manager.submit(lambda job: None))
+    assert ran == []
+    for job_id in (running, queued):
+        job = manager.get(job_id)
+        assert (job.status, job.result, job.progress) == (jobs.CANCELLED, None, None)
+    assert not manager.cancel(running)
+    assert not manager.cancel("unknown")
+
+
+def test_finished_jobs_are_pruned_after_retention():
+    manager = JobManager(max_workers=1, retention_seconds=60)
+    old = wait_for(manager, manager.submit(lambda job: None))
+    old.finished -= 120
+    manager.submit(lambda job: None)
+    assert manager.get(old.id) is None
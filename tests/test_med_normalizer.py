@@ -0,0 +1,36 @@
+from interactions import InteractionEngine
+from med_normalizer import MedicationNormalizer
+
+
+def test_combination_with_shared_unit_strengths():
+    record = MedicationNormalizer().parse_entry("Paracetamol/Caffeine 500/65mg")
+    assert record.name == "caffeine+paracetamol"
+    assert record.strength == "65 mg + 500 mg"
+
+
+def test_frequency_and_filler_are_separated_from_the_name():
+    record = MedicationNormalizer().parse_entry("Take Metformin 500mg tablet twice daily")
+    assert (record.name, record.strength, record.frequency) == ("metformin", "500 mg", "twice daily")
+    assert record.label == "metformin 500 mg twice daily"
+
+
+def test_interaction_queries_keep_the_dose():
+    asked = []
+
+    def run_pair(primary, other, deadline):
+        asked.append(other)
+        return "No interaction."
+
+    engine = InteractionEngine(run_pair, cache=None, normalizer=MedicationNormalizer())
+    report = engine.analyze("Aspirin 75mg", "metformin 500mg bd, Metformin 500 mg twice a day")
+    assert asked == ["metformin 500 mg twice daily"]
+    assert "#### Aspirin 75mg + metformin 500 mg twice daily" in report
+    assert engine.medication_names("metformin 500mg bd") == ["metformin"]
+
+
+def test_same_drug_at_different_strengths_keeps_both_entries():
+    records = MedicationNormalizer().normalize("Warfarin 5mg, warfarin 2mg, Warfarin 5 mg")
+    assert [record.label for record in records] == ["warfarin 5 mg", "warfarin 2 mg"]
+    engine = InteractionEngine(lambda *args: "", cache=None, normalizer=MedicationNormalizer())
+    assert engine.medication_names("Warfarin 5mg, warfarin 2mg") == ["warfarin"]
+    assert engine.medications_key("warfarin 2mg; Warfarin 5mg") == engine.medications_key("Warfarin 5mg, warfarin 2mg")
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from metrics import BUCKETS, Histogram, Registry
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram()
+    for seconds in (0.001, 0.02, 0.02, 3, 200):
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["sum"] == pytest.approx(203.041)
+    assert snapshot["buckets"][BUCKETS.index(0.001)] == 1
+    assert snapshot["buckets"][BUCKETS.index(0.025)] == 2
+    assert snapshot["buckets"][-1] == 1
+    assert (snapshot["p50"], snapshot["p99"]) == (0.02, 200)
+    assert Histogram().snapshot()["p95"] is None
+
+
+def test_percentiles_use_the_recent_window():
+    histogram = Histogram(window=2)
+    for seconds in (10, 1, 1):
+        histogram.observe(seconds)
+    assert histogram.snapshot()["p99"] == 1
+    assert histogram.snapshot()["count"] == 3
+
+
+def test_spans_are_recorded_even_when_they_raise():
+    registry = Registry()
+
+    @registry.timed("analysis")
+    def analyze():
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        analyze()
+    with registry.span("analysis"):
+        pass
+    assert registry.snapshot()["stages"]["analysis"]["count"] == 2
+
+
+def test_snapshot_collects_counters_and_sources():
+    registry = Registry()
+    registry.increment("cache_hit")
+    registry.increment("cache_hit", 2)
+    registry.register_source("cache", lambda: {"hits": 3})
+    registry.register_source("broken", lambda: 1 / 0)
+    snapshot = registry.snapshot()
+    assert snapshot["counters"] == {"cache_hit": 3}
+    assert snapshot["sources"] == {"cache": {"hits": 3}}
+    registry.reset()
+    assert registry.snapshot()["counters"] == {}
+    assert registry.snapshot()["sources"] == {"cache": {"hits": 3}}
+
+
+def test_prometheus_buckets_are_cumulative():
+    registry = Registry()
+    registry.observe("pdf", 0.003)
+    registry.observe("pdf", 0.3)
+    registry.increment("jobs")
+    registry.register_source("cache", lambda: {"hits": 4, "table": "results"})
+    text = registry.to_prometheus()
+    assert 'mediscan_stage_seconds_bucket{stage="pdf",le="0.005"} 1' in text
+    assert 'mediscan_stage_seconds_bucket{stage="pdf",le="+Inf"} 2' in text
+    assert 'mediscan_stage_seconds_count{stage="pdf"} 2' in text
+    assert 'mediscan_events_total{event="jobs"} 1' in text
+    assert 'mediscan_source{source="cache",key="hits"} 4' in text
+    assert 'key="table"' not in text
+
+
+def test_dump_picks_the_format_from_the_extension(tmp_path):
+    registry = Registry()
+    registry.increment("jobs")
+    registry.dump(str(tmp_path / "metrics.json"))
+    registry.dump(str(tmp_path / "metrics.prom"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"] == {"jobs": 1}
+    assert (tmp_path / "metrics.prom").read_text().startswith("# TYPE mediscan_stage_seconds histogram")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "metrics.prom"]
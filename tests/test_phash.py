@@ -0,0 +1,65 @@
+import io
+import random
+
+from PIL import Image, ImageFilter
+
+from core import analysis_cache_key
+from phash import BKTree, NearDuplicateIndex, dhash, hamming_distance
+
+
+def photo(seed=0, blur=0, size=(256, 192)):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, "white")
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 40, y + 30))
+    if blur:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_near_duplicates_hash_close_and_different_images_far():
+    original = dhash(photo(seed=1))
+    assert hamming_distance(original, dhash(photo(seed=1, blur=1))) <= 6
+    assert hamming_distance(original, dhash(photo(seed=2))) > 6
+
+
+def test_bk_tree_finds_everything_within_the_distance_closest_first():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for index, item_hash in enumerate(hashes):
+        tree.add(item_hash, index)
+    query = hashes[0] ^ 0b101
+    expected = sorted((hamming_distance(query, h), i) for i, h in enumerate(hashes) if hamming_distance(query, h) <= 10)
+    matches = tree.search(query, 10)
+    assert sorted(matches) == expected
+    assert [distance for distance, _ in matches] == sorted(distance for distance, _ in matches)
+    assert len(tree) == 500
+
+
+def test_index_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    NearDuplicateIndex(path).add(0b1111, "result-key")
+    NearDuplicateIndex(path).add(0b1111, "result-key")
+    index = NearDuplicateIndex(path)
+    assert len(index) == 1
+    assert index.find(0b0111) == [(1, "result-key")]
+
+
+def test_find_similar_skips_the_image_itself_and_counts_no_hits(make_analyzer):
+    analyzer = make_analyzer()
+    seen = photo(seed=3)
+    look_alike = photo(seed=3, blur=1)
+    seen_key = analysis_cache_key(seen, analyzer.prompt_version())
+    analyzer.result_cache.set(seen_key, "*Composition:* Paracetamol 500mg")
+    analyzer.duplicate_index.add(dhash(seen), seen_key)
+
+    assert analyzer.find_similar(dhash(seen), exclude_key=seen_key) is None
+    distance, analysis = analyzer.find_similar(
+        dhash(look_alike), exclude_key=analysis_cache_key(look_alike, analyzer.prompt_version())
+    )
+    assert analysis == "*Composition:* Paracetamol 500mg"
+    assert analyzer.result_cache.stats()["hits"] == 0
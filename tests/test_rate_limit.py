@@ -0,0 +1,105 @@
+import threading
+import time
+
+from rate_limit import RateLimiter
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    held = limiter.acquire()
+    admitted = []
+
+    def call(name):
+        with limiter.slot():
+            admitted.append(name)
+
+    threads = []
+    for name in "abcd":
+        thread = threading.Thread(target=call, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # Queue each caller before the next one arrives
+        wait_until(lambda: limiter.stats()["queued"] == len(threads))
+    limiter.release(held)
+    for thread in threads:
+        thread.join()
+    assert admitted == list("abcd")
+
+
+def test_concurrency_cap_is_never_exceeded():
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=2)
+    lock = threading.Lock()
+    active = peak = 0
+
+    def call():
+        nonlocal active, peak
+        with limiter.slot():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2
+    assert limiter.stats()["admitted"] == 8
+    assert limiter.stats()["active"] == 0
+
+
+def test_token_bucket_spaces_calls_beyond_the_burst():
+    # Burst of max_concurrent tokens, then one every 0.1s
+    limiter = RateLimiter("test", requests_per_minute=600, max_concurrent=2)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.release(limiter.acquire())
+    assert time.monotonic() - started >= 0.08
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    held = limiter.acquire()
+    assert limiter.acquire(timeout=0.05) is None
+    assert limiter.stats()["queued"] == 0
+    limiter.release(held)
+    limiter.release(limiter.acquire(timeout=0.05))
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    held = limiter.acquire()
+    assert limiter.try_acquire() is None
+    waiter = threading.Thread(target=lambda: limiter.release(limiter.acquire()))
+    waiter.start()
+    wait_until(lambda: limiter.stats()["queued"] == 1)
+    limiter.release(held)
+    waiter.join()
+    # Let the one-token bucket refill
+    time.sleep(0.01)
+    token = limiter.try_acquire()
+    assert token is not None
+    limiter.release(token)
+
+
+def test_queue_position_is_reported_until_admitted():
+    limiter = RateLimiter("test", requests_per_minute=60_000, max_concurrent=1)
+    held = limiter.acquire()
+    reports = []
+    waiter = threading.Thread(target=lambda: limiter.release(limiter.acquire(lambda *status: reports.append(status))))
+    waiter.start()
+    wait_until(lambda: reports)
+    limiter.release(held)
+    waiter.join()
+    assert reports[0][0] == 1
+    assert reports[-1] == (0, 0)
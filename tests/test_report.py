@@ -0,0 +1,34 @@
+import pytest
+
+import report
+from core import DrugReport
+
+
+@pytest.fixture
+def drug_report():
+    return DrugReport.parse("*Composition:* Paracetamol 500mg\n*Uses:* Fever <38.5C> & mild pain")
+
+
+def test_create_pdf_with_image_and_interactions(drug_report, tablet_image):
+    pdf = report.create_pdf(tablet_image, drug_report, "**Minor** <interaction>", "Aspirin", "12 tokens")
+    assert pdf.startswith(b"%PDF")
+    assert b"Model usage: 12 tokens" in pdf
+
+
+def test_create_pdf_survives_a_broken_image(drug_report):
+    assert report.create_pdf(b"not an image", drug_report).startswith(b"%PDF")
+
+
+def test_cached_pdf_builds_once_per_input(monkeypatch, drug_report):
+    builds = []
+
+    def create_pdf(*args):
+        builds.append(args)
+        return b"%PDF-" + str(len(builds)).encode()
+
+    monkeypatch.setattr(report, "create_pdf", create_pdf)
+    monkeypatch.setattr(report, "_pdf_cache", report.LRUCache(max_entries=4))
+    first = report.cached_pdf(b"image", drug_report)
+    assert report.cached_pdf(b"image", drug_report) == first
+    assert report.cached_pdf(b"image", drug_report, usage_summary="1 token") != first
+    assert len(builds) == 2
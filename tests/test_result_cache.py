@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from result_cache import LRUCache, ResultCache, content_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_content_key_is_stable_and_length_prefixed():
+    assert content_key("a", b"b") == content_key(b"a", "b")
+    assert content_key("ab", "c") != content_key("a", "bc")
+    assert content_key(None) == content_key("")
+
+
+def test_get_after_set_counts_hits_and_misses(cache):
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResultCache(path).set("key", "value")
+    assert ResultCache(path).get("key") == "value"
+
+
+def test_tables_are_independent(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResultCache(path).set("key", "analysis")
+    assert ResultCache(path, table="interaction_pairs").get("key") is None
+
+
+def test_invalid_table_name_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResultCache(str(tmp_path / "cache.sqlite3"), table="results; DROP TABLE results")
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.set("key", "value")
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "1")
+    time.sleep(0.01)
+    cache.set("b", "2")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_lru_cache_bounds_entries():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert len(lru) == 2
+
+
+def test_peek_neither_counts_nor_refreshes(cache):
+    cache.set("key", "value")
+    assert cache.peek("key") == "value"
+    assert cache.peek("missing") is None
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
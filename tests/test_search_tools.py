@@ -0,0 +1,42 @@
+from fake_models import FakeSearchClient
+from rate_limit import RateLimiter
+from result_cache import ResultCache
+from search_tools import SearchPool, normalize_query
+
+
+def make_pool(tmp_path, **kwargs):
+    client = FakeSearchClient()
+    cache = ResultCache(path=str(tmp_path / "search.sqlite3"), table="search_results")
+    return SearchPool("tavily-key", cache=cache, client=client, **kwargs), client
+
+
+def test_normalize_query():
+    assert normalize_query("  Crocin   side-effects? ") == normalize_query("crocin side effects") == "crocin side effects"
+
+
+def test_equivalent_queries_share_one_upstream_search(tmp_path):
+    pool, client = make_pool(tmp_path)
+    first = pool.tools().web_search_using_tavily("Crocin uses")
+    assert "Summary for Crocin uses." in first
+    assert pool.tools().web_search_using_tavily("crocin, USES") == first
+    assert client.calls == 1
+    stats = pool.stats()
+    assert (stats["searches"], stats["upstream_searches"]) == (2, 1)
+
+
+def test_result_size_is_part_of_the_key(tmp_path):
+    pool, client = make_pool(tmp_path)
+    tools = pool.tools()
+    tools.web_search_using_tavily("crocin", max_results=3)
+    tools.web_search_using_tavily("crocin", max_results=5)
+    assert client.calls == 2
+
+
+
+def test_only_upstream_searches_go_through_the_limiter(tmp_path):
+    limiter = RateLimiter("search", requests_per_minute=60_000, max_concurrent=1)
+    pool, client = make_pool(tmp_path, limiter=limiter)
+    pool.tools().web_search_using_tavily("crocin")
+    pool.tools().web_search_using_tavily("Crocin")
+    assert client.calls == 1
+    assert limiter.stats()["admitted"] == 1
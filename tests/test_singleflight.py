@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start callers threads calling flight.do(key, fn) while the leader is blocked; return their outcomes."""
+    outcomes = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            outcome = flight.do(key, fn)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return "result"
+
+    threads, outcomes = run_concurrently(flight, "key", fn, 4)
+    while flight.coalesced < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(runs) == 1
+    assert sorted(outcomes, key=lambda outcome: outcome[1]) == [("result", False)] + [("result", True)] * 3
+    assert flight.inflight() == 0
+
+
+def test_exception_reaches_every_waiter_and_is_not_remembered():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError("model down")
+
+    def fail():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = run_concurrently(flight, "key", fail, 3)
+    while flight.coalesced < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert outcomes == [error] * 3
+    assert flight.inflight() == 0
+    # The next call runs afresh
+    assert flight.do("key", lambda: "recovered") == ("recovered", False)
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    assert flight.coalesced == 0
+
+
+def test_leader_exception_propagates():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.inflight() == 0
@@ -0,0 +1,67 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import usage
+from usage import BudgetExceeded, Usage, UsageLedger
+
+
+def image(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_from_run_totals_model_turns_and_tool_calls():
+    response = SimpleNamespace(
+        metrics={"input_tokens": [100, 250], "output_tokens": [20, 40]},
+        messages=[
+            SimpleNamespace(role="user"),
+            SimpleNamespace(role="tool"),
+            SimpleNamespace(role="tool", combined_function_details=[{}, {}, {}]),
+            SimpleNamespace(role="assistant"),
+        ],
+    )
+    run_usage = Usage.from_run(response, image_tokens=258)
+    assert run_usage.as_dict() == {"input_tokens": 350, "output_tokens": 60, "image_tokens": 258,
+                                   "tool_calls": 4, "model_calls": 1, "total_tokens": 410}
+    assert Usage.from_run(SimpleNamespace(metrics=None, messages=None)).total_tokens == 0
+
+
+def test_estimate_image_tokens_counts_tiles():
+    assert usage.estimate_image_tokens(image(384, 200)) == 258
+    assert usage.estimate_image_tokens(image(768, 400)) == 258
+    assert usage.estimate_image_tokens(image(1024, 1024)) == 4 * 258
+
+
+def test_ledger_totals_per_day_and_enforces_the_budget(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite3"))
+    ledger.add(Usage(input_tokens=600, output_tokens=100, model_calls=1))
+    ledger.add(Usage(input_tokens=200, output_tokens=50, model_calls=1))
+    ledger.add(Usage(input_tokens=5000), day=date(2020, 1, 1))
+    today = ledger.day()
+    assert (today.total_tokens, today.model_calls) == (950, 2)
+    ledger.check_budget(1000)
+    ledger.check_budget(0)
+    ledger.add(Usage(output_tokens=50))
+    with pytest.raises(BudgetExceeded):
+        ledger.check_budget(1000)
+
+
+def test_track_collects_runs_from_worker_threads(tmp_path):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite3"))
+    usage.record(Usage(input_tokens=1))
+    with usage.track() as collected:
+        usage.record(Usage(input_tokens=10, model_calls=1), ledger)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [usage.submit(pool, usage.record, Usage(output_tokens=5, model_calls=1)) for _ in range(2)]
+            for future in futures:
+                future.result()
+            # A plain submit runs outside the tracked context
+            pool.submit(usage.record, Usage(output_tokens=1000)).result()
+    assert (collected.input_tokens, collected.output_tokens, collected.model_calls) == (10, 10, 3)
+    assert ledger.day().total_tokens == 10
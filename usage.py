@@ -0,0 +1,163 @@
+"""Token, tool call and image cost accounting for agent runs, with daily totals and budgets.
+
+Wrap a unit of work in track() to collect the usage of every agent run inside it,
+including runs on worker threads started through submit():
+
+    with usage.track() as request_usage:
+        analyzer.extract_composition_and_details(image_bytes)
+    print(request_usage.summary())
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date
+from io import BytesIO
+
+from PIL import Image
+
+import metrics
+from result_cache import DEFAULT_CACHE_PATH
+
+# 0 disables a budget
+DAILY_TOKEN_BUDGET = int(os.environ.get("MEDISCAN_DAILY_TOKEN_BUDGET", 0))
+SESSION_TOKEN_BUDGET = int(os.environ.get("MEDISCAN_SESSION_TOKEN_BUDGET", 0))
+# Gemini bills images up to 384 px on both sides as one tile and larger ones per 768 px tile
+IMAGE_TILE_TOKENS = 258
+IMAGE_TILE_PIXELS = 768
+SMALL_IMAGE_PIXELS = 384
+
+FIELDS = ("input_tokens", "output_tokens", "image_tokens", "tool_calls", "model_calls")
+
+
+class BudgetExceeded(RuntimeError):
+    """A token budget is used up."""
+
+
+class Usage:
+    """Additive usage counters; safe to add to from several threads."""
+
+    __slots__ = FIELDS + ("_lock",)
+
+    def __init__(self, **counts):
+        self._lock = threading.Lock()
+        for field in FIELDS:
+            setattr(self, field, counts.get(field, 0))
+
+    @classmethod
+    def from_run(cls, response, image_tokens=0):
+        """Usage of one phi RunResponse; Gemini reports tokens per model turn."""
+        run_metrics = response.metrics or {}
+        return cls(
+            input_tokens=sum(run_metrics.get("input_tokens", ())),
+            output_tokens=sum(run_metrics.get("output_tokens", ())),
+            image_tokens=image_tokens,
+            tool_calls=count_tool_calls(response.messages),
+            model_calls=1,
+        )
+
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other):
+        with self._lock:
+            for field in FIELDS:
+                setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def as_dict(self):
+        counts = {field: getattr(self, field) for field in FIELDS}
+        counts["total_tokens"] = self.total_tokens
+        return counts
+
+    def summary(self):
+        return (f"{self.input_tokens:,} input + {self.output_tokens:,} output tokens "
+                f"(~{self.image_tokens:,} for images), {self.tool_calls} tool calls, {self.model_calls} model calls")
+
+
+def count_tool_calls(messages):
+    """Tool calls made during a run, from its messages.
+
+    RunResponse.tools is only filled in when streaming, but every run keeps its tool
+    result messages. Gemini folds the results of parallel calls into one message.
+    """
+    calls = 0
+    for message in messages or ():
+        if message.role == "tool":
+            calls += len(getattr(message, "combined_function_details", None) or ()) or 1
+    return calls
+
+
+def estimate_image_tokens(image_bytes):
+    """Approximate prompt tokens Gemini charges for an image, from its pixel size."""
+    width, height = Image.open(BytesIO(image_bytes)).size
+    if width <= SMALL_IMAGE_PIXELS and height <= SMALL_IMAGE_PIXELS:
+        return IMAGE_TILE_TOKENS
+    tiles = -(-width // IMAGE_TILE_PIXELS) * -(-height // IMAGE_TILE_PIXELS)
+    return tiles * IMAGE_TILE_TOKENS
+
+
+class UsageLedger:
+    """Per-day usage totals, persisted next to the result cache."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS daily_usage (day TEXT PRIMARY KEY, "
+            + ", ".join(f"{field} INTEGER NOT NULL DEFAULT 0" for field in FIELDS) + ")"
+        )
+
+    def add(self, usage, day=None):
+        counts = [getattr(usage, field) for field in FIELDS]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO daily_usage (day, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)}) "
+                f"ON CONFLICT(day) DO UPDATE SET {', '.join(f'{field} = {field} + excluded.{field}' for field in FIELDS)}",
+                [(day or date.today()).isoformat()] + counts,
+            )
+
+    def day(self, day=None):
+        """Usage recorded on a day (today by default)."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM daily_usage WHERE day = ?", ((day or date.today()).isoformat(),)
+            ).fetchone()
+        return Usage(**dict(zip(FIELDS, row))) if row else Usage()
+
+    def check_budget(self, budget=DAILY_TOKEN_BUDGET):
+        """Raise BudgetExceeded once today's tokens reach budget."""
+        if budget and self.day().total_tokens >= budget:
+            raise BudgetExceeded(f"The daily budget of {budget:,} tokens is used up. Please try again tomorrow.")
+
+
+_current = contextvars.ContextVar("mediscan_usage", default=None)
+
+
+@contextmanager
+def track():
+    """Collect the usage of every run recorded inside the with block into a new Usage."""
+    collected = Usage()
+    token = _current.set(collected)
+    try:
+        yield collected
+    finally:
+        _current.reset(token)
+
+
+def submit(executor, fn, *args):
+    """executor.submit that keeps recording into the caller's track() block."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def record(run_usage, ledger=None):
+    """Add one run's usage to the current track() block, the daily ledger and the metrics counters."""
+    collected = _current.get()
+    if collected is not None:
+        collected.add(run_usage)
+    if ledger is not None:
+        ledger.add(run_usage)
+    for field in FIELDS:
+        metrics.increment(field, getattr(run_usage, field))